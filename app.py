@@ -7,19 +7,23 @@ import json
 import logging
 import threading
 import sys
+import atexit
+from collections import OrderedDict
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
 from flask_socketio import SocketIO, emit
-from PIL import Image
 import io
 import base64
+from urllib.parse import quote
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('XmlViewer')
 
 # 导入自定义模块
-from app.modules import DeviceManager, UICapturer
+from app.modules import DeviceManager, UICapturer, ScreenIndex, CaptureHistory, SessionRecorder, SessionReader, CPUWorkerPool, ScreenStreamer
+from app.modules.cpu_pool import process_capture, parse_capture, encode_shared_image
+from app.modules.hierarchy_audit import audit_xml, list_archive_dumps, merge_summaries, DEFAULT_MIN_TOUCH_SIZE
 
 app = Flask(__name__, static_folder='app/static', template_folder='app/templates')
     
@@ -37,27 +41,85 @@ socketio = SocketIO(
 # 初始化设备管理器和UI捕获器
 device_manager = DeviceManager()
 ui_capturer = UICapturer(device_manager)
+# 屏幕指纹索引，跨会话持久化到当前目录
+screen_index = ScreenIndex(os.path.join(os.getcwd(), 'screen_index.jsonl'))
+# 退出时写入尚未保存的出现次数
+atexit.register(screen_index.flush)
+last_screen_id = None
+# 最近捕获的节点索引，用于捕获之间的差异比较
+capture_history = CaptureHistory()
+last_capture_id = None
+# 会话录制器，以及按路径缓存的会话读取器（最近使用的若干个）
+session_recorder = SessionRecorder()
+session_readers = OrderedDict()
+session_readers_lock = threading.Lock()
+MAX_SESSION_READERS = 8
+# CPU工作池，解析和图片编码不在Web服务线程中执行
+cpu_pool = CPUWorkerPool()
+
+# 屏幕流，高帧率推送截图，层次结构捕获使用最接近的帧
+screen_streamer = ScreenStreamer(device_manager)
+ui_capturer.frame_source = screen_streamer.nearest_frame_image
+# 订阅屏幕流的客户端，记录每个客户端最后发送和最后确认的帧序号
+stream_subscribers = {}
+stream_subscribers_lock = threading.Lock()
+# 客户端已发送但未确认的帧达到此数量时丢弃新帧
+STREAM_MAX_IN_FLIGHT = 2
+stream_dropped_frames = 0
 
 # 注册UI捕获回调
 def on_ui_captured(xml_content, screenshot):
     """UI捕获完成后的回调函数"""
+    global last_screen_id, last_capture_id
     try:
-        # 解析XML
-        root, node_data, tree_html = ui_capturer.parse_hierarchy(xml_content)
+        # 解析XML、计算指纹和编码截图都交给工作池，工作池繁忙时只跳过界面推送
+        shared, image_handle = cpu_pool.share_image(screenshot) if screenshot else (None, None)
+        future = cpu_pool.submit(process_capture, xml_content, image_handle, block=False, shared=shared)
+        if future is None:
+            logger.warning("CPU工作池繁忙，跳过本次界面更新")
+            # 本次捕获没有指纹和节点索引，清除上一次的ID，避免与新数据错配
+            last_screen_id = None
+            last_capture_id = None
+            # 录制不需要解析，原始XML和截图照常写入
+            if session_recorder.recording:
+                session_recorder.add_frame(xml_content, screenshot, {
+                    'screen_id': None,
+                    'capture_id': None
+                }, time.time())
+            return
+        result = future.result()
+        node_data = result['node_data']
+        tree_html = result['tree_html']
+        
+        # 按指纹入库，相近屏幕不会重复入库
+        screen_id, is_new_screen = screen_index.add_fingerprint(
+            result['image_hash'], result['structure_hash'], {'timestamp': time.time()})
+        last_screen_id = screen_id
+        
+        # 记录节点索引，供差异比较使用
+        capture_id = capture_history.add(node_data, time.time()) if node_data else None
+        last_capture_id = capture_id
+        
+        # 录制会话帧，复用工作池已编码的PNG
+        if session_recorder.recording:
+            png_bytes = result['png'] if session_recorder.image_format == 'PNG' else None
+            session_recorder.add_frame(xml_content, screenshot, {
+                'screen_id': screen_id,
+                'capture_id': capture_id
+            }, time.time(), image_bytes=png_bytes)
         
         # 转换截图为Base64
-        if screenshot:
-            buffered = io.BytesIO()
-            screenshot.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        else:
-            img_str = None
+        img_str = base64.b64encode(result['png']).decode('utf-8') if result['png'] else None
         
         # 发送数据到前端
         socketio.emit('ui_data', {
             'nodes': node_data,
             'tree_html': tree_html,
             'screenshot': img_str,
+            'screen_id': screen_id,
+            'is_new_screen': is_new_screen,
+            'capture_id': capture_id,
+            'frame_seq': ui_capturer.last_frame_seq,
             'timestamp': time.time()
         })
     except Exception as e:
@@ -67,6 +129,50 @@ def on_ui_captured(xml_content, screenshot):
 # 添加回调
 ui_capturer.add_capture_callback(on_ui_captured)
 
+def on_screen_frame(frame):
+    """屏幕流新帧回调，只推送给已跟上进度的客户端，其余客户端丢弃该帧"""
+    global stream_dropped_frames
+    with stream_subscribers_lock:
+        targets = []
+        for sid, subscriber in stream_subscribers.items():
+            # 只按已发送未确认的帧数判断，被丢弃的帧不会被确认，不能与新帧的序号比较
+            if subscriber['sent'] - subscriber['acked'] < STREAM_MAX_IN_FLIGHT:
+                subscriber['sent'] = frame['seq']
+                targets.append(sid)
+            else:
+                stream_dropped_frames += 1
+    if not targets:
+        return
+    
+    payload = {
+        'seq': frame['seq'],
+        'timestamp': frame['timestamp'],
+        'mimetype': frame['mimetype'],
+        'image': base64.b64encode(frame['data']).decode('utf-8')
+    }
+    for sid in targets:
+        socketio.emit('screen_frame', payload, to=sid)
+
+screen_streamer.add_frame_callback(on_screen_frame)
+
+def on_stream_stopped():
+    """屏幕流停止回调（断开设备、设备掉线等），通知所有订阅者并清空订阅"""
+    with stream_subscribers_lock:
+        sids = list(stream_subscribers)
+        stream_subscribers.clear()
+    status = screen_streamer.get_status()
+    for sid in sids:
+        socketio.emit('stream_status', status, to=sid)
+
+screen_streamer.add_stop_callback(on_stream_stopped)
+
+def stop_stream_if_unused():
+    """没有订阅者时停止屏幕流"""
+    with stream_subscribers_lock:
+        unused = not stream_subscribers
+    if unused:
+        screen_streamer.stop()
+
 # 路由定义
 @app.route('/')
 def index():
@@ -126,7 +232,7 @@ def capture():
     
     if result:
         # 解析UI层次结构
-        root, node_data, tree_html = ui_capturer.parse_hierarchy()
+        node_data, tree_html = cpu_pool.run(parse_capture, ui_capturer.last_xml)
         
         # 准备截图数据
         screenshot_url = None
@@ -138,6 +244,8 @@ def capture():
             'node_data': node_data,
             'tree_html': tree_html,
             'screenshot_url': screenshot_url,
+            'screen_id': last_screen_id,
+            'capture_id': last_capture_id,
             'timestamp': ui_capturer.last_capture_time
         })
     else:
@@ -182,6 +290,11 @@ def save_capture():
     
     result = ui_capturer.save_last_capture(xml_path, img_path)
     
+    # 记录保存路径，便于从相似屏幕跳转到存档
+    if result and last_screen_id:
+        screen_index.update_metadata(last_screen_id, xml_path=xml_path,
+                                     img_path=img_path if ui_capturer.last_screenshot else None)
+    
     return jsonify({
         'success': result,
         'xml_path': xml_path if result else None,
@@ -195,27 +308,9 @@ def get_screenshot():
         return jsonify({'error': '没有可用的屏幕截图'}), 404
     
     try:
-        # 将截图转换为字节流
-        img_io = io.BytesIO()
-        
-        # 复制图像以避免并发访问问题
-        img_copy = ui_capturer.last_screenshot.copy()
-        
-        # 可能的优化：缩小尺寸以减少传输数据量
-        max_dim = 1080  # 最大尺寸限制
-        width, height = img_copy.size
-        if width > max_dim or height > max_dim:
-            if width > height:
-                new_width = max_dim
-                new_height = int(height * (max_dim / width))
-            else:
-                new_height = max_dim
-                new_width = int(width * (max_dim / height))
-            img_copy = img_copy.resize((new_width, new_height), Image.LANCZOS)
-        
-        # 使用更低的品质来减小文件大小
-        img_copy.save(img_io, 'JPEG', quality=85, optimize=True)
-        img_io.seek(0)
+        # 在工作池中缩小尺寸并编码为JPEG，截图像素通过共享内存传递
+        shared, image_handle = cpu_pool.share_image(ui_capturer.last_screenshot)
+        img_io = io.BytesIO(cpu_pool.run(encode_shared_image, image_handle, 'JPEG', 1080, 85, shared=shared))
         
         # 设置合适的缓存控制和内容大小头
         response = send_file(img_io, mimetype='image/jpeg', download_name='screenshot.jpg')
@@ -228,12 +323,239 @@ def get_screenshot():
         logger.error(f"获取截图时出错: {str(e)}")
         return jsonify({'error': f'获取截图时出错: {str(e)}'}), 500
 
+@app.route('/api/screens/similar')
+def get_similar_screens():
+    """查找与指定屏幕（默认最近一次捕获）相似的已入库屏幕"""
+    screen_id = request.args.get('screen_id') or last_screen_id
+    if not screen_id:
+        return jsonify({'error': '没有可用的屏幕指纹'}), 404
+    
+    entry = screen_index.get(screen_id)
+    if entry is None:
+        return jsonify({'error': f'屏幕不存在: {screen_id}'}), 404
+    
+    max_distance = request.args.get('max_distance', 10, type=int)
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({
+        'screen': entry,
+        'similar': screen_index.find_similar_to(screen_id, max_distance, limit)
+    })
+
+@app.route('/api/screens/status')
+def get_screen_index_status():
+    """获取屏幕索引状态"""
+    return jsonify(screen_index.get_status())
+
+@app.route('/api/diff')
+def get_capture_diff():
+    """比较两次捕获的层次结构差异，默认比较最近两次捕获"""
+    latest = capture_history.latest_ids(2)
+    base_id = request.args.get('base', type=int)
+    target_id = request.args.get('target', type=int)
+    if target_id is None:
+        target_id = latest[-1] if latest else None
+    if base_id is None:
+        base_id = latest[0] if len(latest) == 2 else None
+    if base_id is None or target_id is None:
+        return jsonify({'error': '没有足够的捕获记录用于比较'}), 404
+    
+    result = capture_history.diff(base_id, target_id)
+    if result is None:
+        return jsonify({'error': f'捕获记录不存在或已过期: {base_id}, {target_id}'}), 404
+    return jsonify(result)
+
+def get_session_reader(path):
+    """获取会话读取器，文件大小变化（仍在录制）时只增量读取新增的帧
+
+    被淘汰的读取器可能仍被其他请求使用，因此不主动关闭，
+    只移出缓存，由最后一个持有者释放引用时关闭文件和内存映射
+    """
+    path = os.path.abspath(path)
+    live = session_recorder.recording and os.path.abspath(session_recorder.path) == path
+    with session_readers_lock:
+        reader = session_readers.get(path)
+        if reader is None:
+            reader = SessionReader(path, live)
+            session_readers[path] = reader
+        else:
+            reader.refresh(live)
+        session_readers.move_to_end(path)
+        while len(session_readers) > MAX_SESSION_READERS:
+            session_readers.popitem(last=False)
+        return reader
+
+def resolve_session_path():
+    """从请求参数获取会话文件路径，默认使用最近录制的会话"""
+    path = request.args.get('path') or session_recorder.path
+    if not path or not os.path.exists(path):
+        return None
+    return path
+
+@app.route('/api/session/start', methods=['POST'])
+def start_session_recording():
+    """开始录制会话"""
+    data = request.json or {}
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    path = data.get('path') or os.path.join(os.getcwd(), f'session_{timestamp}.uics')
+    result = session_recorder.start(path)
+    return jsonify({
+        'success': result,
+        'status': session_recorder.get_status()
+    })
+
+@app.route('/api/session/stop', methods=['POST'])
+def stop_session_recording():
+    """停止录制会话"""
+    result = session_recorder.stop()
+    return jsonify({
+        'success': result,
+        'status': session_recorder.get_status()
+    })
+
+@app.route('/api/session/status')
+def get_session_status():
+    """获取会话录制状态"""
+    return jsonify(session_recorder.get_status())
+
+@app.route('/api/session/frames')
+def get_session_frames():
+    """获取会话的帧列表"""
+    path = resolve_session_path()
+    if not path:
+        return jsonify({'error': '会话文件不存在'}), 404
+    try:
+        reader = get_session_reader(path)
+        return jsonify({'path': path, 'frames': reader.frame_info()})
+    except Exception as e:
+        logger.error(f"读取会话失败: {str(e)}")
+        return jsonify({'error': f'读取会话失败: {str(e)}'}), 500
+
+@app.route('/api/session/frame/<int:frame>')
+def get_session_frame(frame):
+    """获取会话中指定帧的层次结构"""
+    path = resolve_session_path()
+    if not path:
+        return jsonify({'error': '会话文件不存在'}), 404
+    try:
+        reader = get_session_reader(path)
+        if frame < 0 or frame >= len(reader):
+            return jsonify({'error': f'帧序号超出范围: {frame}'}), 404
+        
+        node_data, tree_html = cpu_pool.run(parse_capture, reader.get_xml(frame))
+        screenshot_url = None
+        if reader.index[frame][3]:
+            screenshot_url = f'/api/session/frame/{frame}/screenshot?path={quote(path)}'
+        
+        return jsonify({
+            'success': True,
+            'frame': frame,
+            'frame_count': len(reader),
+            'metadata': reader.get_metadata(frame),
+            'node_data': node_data,
+            'tree_html': tree_html,
+            'screenshot_url': screenshot_url
+        })
+    except Exception as e:
+        logger.error(f"读取会话帧失败: {str(e)}")
+        return jsonify({'error': f'读取会话帧失败: {str(e)}'}), 500
+
+@app.route('/api/session/frame/<int:frame>/screenshot')
+def get_session_frame_screenshot(frame):
+    """获取会话中指定帧的截图"""
+    path = resolve_session_path()
+    if not path:
+        return jsonify({'error': '会话文件不存在'}), 404
+    try:
+        reader = get_session_reader(path)
+        if frame < 0 or frame >= len(reader):
+            return jsonify({'error': f'帧序号超出范围: {frame}'}), 404
+        img_bytes = reader.get_image_bytes(frame)
+        if not img_bytes:
+            return jsonify({'error': '该帧没有截图'}), 404
+        
+        mimetype = 'image/jpeg' if img_bytes[:2] == b'\xff\xd8' else 'image/png'
+        return send_file(io.BytesIO(img_bytes), mimetype=mimetype)
+    except Exception as e:
+        logger.error(f"读取会话帧截图失败: {str(e)}")
+        return jsonify({'error': f'读取会话帧截图失败: {str(e)}'}), 500
+
+@app.route('/api/audit')
+def audit_current_capture():
+    """审计最近一次捕获的触控目标、重叠和定位符问题"""
+    if not ui_capturer.last_xml:
+        return jsonify({'error': '没有可用的XML数据'}), 404
+    
+    min_touch_size = request.args.get('min_touch_size', DEFAULT_MIN_TOUCH_SIZE, type=int)
+    try:
+        result = cpu_pool.run(audit_xml, ui_capturer.last_xml, min_touch_size)
+        result['timestamp'] = ui_capturer.last_capture_time
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"审计UI层次结构失败: {str(e)}")
+        return jsonify({'error': f'审计UI层次结构失败: {str(e)}'}), 500
+
+@app.route('/api/audit/archive', methods=['POST'])
+def audit_archive():
+    """审计存档目录中的全部XML文件或会话文件中的全部帧"""
+    data = request.json or {}
+    path = data.get('path')
+    min_touch_size = int(data.get('min_touch_size', DEFAULT_MIN_TOUCH_SIZE))
+    include_issues = bool(data.get('include_issues', False))
+    if not path or not os.path.exists(path):
+        return jsonify({'error': f'存档路径不存在: {path}'}), 404
+    
+    try:
+        # 批量名额用完时提交会阻塞，从而限制同时读入内存的文件数量，并为实时捕获留出名额
+        futures = []
+        if os.path.isdir(path):
+            for xml_path in list_archive_dumps(path):
+                with open(xml_path, 'r', encoding='utf-8') as f:
+                    futures.append((xml_path, cpu_pool.submit_batch(audit_xml, f.read(), min_touch_size)))
+        else:
+            reader = get_session_reader(path)
+            for frame in range(len(reader)):
+                futures.append((f'{path}#{frame}', cpu_pool.submit_batch(audit_xml, reader.get_xml(frame), min_touch_size)))
+        
+        captures = []
+        for source, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                captures.append({'source': source, 'error': str(e)})
+                continue
+            entry = {'source': source, 'node_count': result['node_count'], 'summary': result['summary']}
+            if include_issues:
+                entry['issues'] = result['issues']
+            captures.append(entry)
+        
+        return jsonify({
+            'path': path,
+            'capture_count': len(captures),
+            'min_touch_size': min_touch_size,
+            'totals': merge_summaries(captures),
+            'captures': captures
+        })
+    except Exception as e:
+        logger.error(f"审计存档失败: {str(e)}")
+        return jsonify({'error': f'审计存档失败: {str(e)}'}), 500
+
+@app.route('/api/stream/status')
+def get_stream_status():
+    """获取屏幕流状态"""
+    status = screen_streamer.get_status()
+    with stream_subscribers_lock:
+        status['subscribers'] = len(stream_subscribers)
+    status['dropped_frames'] = stream_dropped_frames
+    return jsonify(status)
+
 @app.route('/api/status')
 def get_status():
     """获取当前状态"""
     return jsonify({
         'device': device_manager.get_status(),
-        'capture': ui_capturer.get_capture_status()
+        'capture': ui_capturer.get_capture_status(),
+        'stream': screen_streamer.get_status(),
+        'workers': cpu_pool.get_status()
     })
 
 # SocketIO事件处理
@@ -247,6 +569,9 @@ def handle_connect():
 def handle_disconnect():
     """客户端断开连接事件"""
     logger.info(f"客户端断开连接: {request.sid}")
+    with stream_subscribers_lock:
+        stream_subscribers.pop(request.sid, None)
+    stop_stream_if_unused()
 
 @socketio.on('get_device_list')
 def handle_get_device_list():
@@ -285,6 +610,9 @@ def handle_disconnect_device():
         if ui_capturer.auto_capture_enabled:
             ui_capturer.stop_auto_capture()
         
+        # 停止屏幕流
+        screen_streamer.stop()
+        
         # 断开设备
         success = device_manager.disconnect()
         emit('connection_status', device_manager.get_status())
@@ -327,6 +655,45 @@ def handle_stop_auto_capture():
         logger.error(f"停止自动捕获失败: {str(e)}")
         emit('error', {'message': f"停止自动捕获失败: {str(e)}"})
 
+@socketio.on('start_screen_stream')
+def handle_start_screen_stream(data):
+    """订阅屏幕流"""
+    try:
+        fps = (data or {}).get('fps', 10)
+        with stream_subscribers_lock:
+            stream_subscribers[request.sid] = {'sent': 0, 'acked': 0}
+        success = screen_streamer.start(fps)
+        if not success:
+            with stream_subscribers_lock:
+                stream_subscribers.pop(request.sid, None)
+        emit('stream_status', screen_streamer.get_status())
+    except Exception as e:
+        logger.error(f"启动屏幕流失败: {str(e)}")
+        emit('error', {'message': f"启动屏幕流失败: {str(e)}"})
+
+@socketio.on('stop_screen_stream')
+def handle_stop_screen_stream():
+    """取消订阅屏幕流"""
+    try:
+        with stream_subscribers_lock:
+            stream_subscribers.pop(request.sid, None)
+        stop_stream_if_unused()
+        emit('stream_status', screen_streamer.get_status())
+    except Exception as e:
+        logger.error(f"停止屏幕流失败: {str(e)}")
+        emit('error', {'message': f"停止屏幕流失败: {str(e)}"})
+
+@socketio.on('screen_frame_ack')
+def handle_screen_frame_ack(data):
+    """客户端确认已显示的帧"""
+    seq = (data or {}).get('seq')
+    if seq is None:
+        return
+    with stream_subscribers_lock:
+        subscriber = stream_subscribers.get(request.sid)
+        if subscriber is not None:
+            subscriber['acked'] = max(subscriber['acked'], seq)
+
 @socketio.on('save_capture')
 def handle_save_capture(data):
     """保存捕获结果"""
@@ -361,12 +728,18 @@ if __name__ == '__main__':
                 'details': str(e)
             }), 500
         
+        # 调试模式下Werkzeug重载器的监视进程也会执行到这里，但不处理请求；
+        # 只在实际提供服务的进程中（WERKZEUG_RUN_MAIN为true）于启动Web服务线程之前创建工作进程
+        debug = True
+        if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            cpu_pool.start()
+        
         # 显示启动信息
         logger.info("XML Viewer Web服务已启动")
         logger.info("请在浏览器中访问: http://127.0.0.1:5000")
         
         # 启动Flask应用
-        socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
+        socketio.run(app, host='0.0.0.0', port=5000, debug=debug, allow_unsafe_werkzeug=True)
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
         sys.exit(0)
@@ -3,5 +3,11 @@
 
 from .device_manager import DeviceManager
 from .ui_capturer import UICapturer
+from .screen_index import ScreenIndex
+from .hierarchy_diff import CaptureHistory, diff_hierarchies
+from .session_recorder import SessionRecorder, SessionReader
+from .cpu_pool import CPUWorkerPool
+from .screen_streamer import ScreenStreamer
+from .hierarchy_audit import audit_nodes, audit_xml
 
-__all__ = ['DeviceManager', 'UICapturer']
+__all__ = ['DeviceManager', 'UICapturer', 'ScreenIndex', 'CaptureHistory', 'diff_hierarchies', 'SessionRecorder', 'SessionReader', 'CPUWorkerPool', 'ScreenStreamer', 'audit_nodes', 'audit_xml']
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Any, Optional, Callable, Tuple
+from PIL import Image
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+SHAREABLE_MODES = ('RGB', 'RGBA', 'L')
+
+
+class CPUWorkerPool:
+    """CPU工作池，将XML解析和图片编码移出Web服务所在的进程，避免大页面阻塞HTTP请求
+
+    支持fork的平台使用进程池，否则退回线程池；截图通过共享内存传递而不是序列化，
+    同时在处理中的任务数达到上限时进行背压
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """初始化工作池"""
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.max_pending = max_pending or self.max_workers * 2
+        self.pending = threading.BoundedSemaphore(self.max_pending)
+        # 批量任务（如存档审计）单独限流，至少为实时捕获留出一个名额
+        self.batch_pending = threading.BoundedSemaphore(max(1, self.max_pending - 1))
+        self.pending_count = 0
+        self.dropped_count = 0
+        self.lock = threading.Lock()
+        self.executor = None
+        self.restart_lock = threading.Lock()
+        self.restart_count = 0
+        self.use_processes = 'fork' in multiprocessing.get_all_start_methods()
+
+    def start(self) -> None:
+        """启动工作池
+
+        应在启动Web服务线程之前调用，此时进程中只有主线程，fork是安全的。
+        未提前调用时在首次提交任务时惰性启动，工作池重建时也会再次启动，这两种情况都从多线程进程中fork；
+        工作进程只执行本模块中的纯计算任务，不依赖其他线程持有的锁，因此仍可工作，但会记录警告。
+        不改用forkserver/spawn，因为它们会在每个工作进程中重新执行__main__模块（即整个app.py）
+        """
+        if self.executor is not None:
+            return
+        if self.use_processes:
+            if threading.active_count() > 1:
+                logger.warning(f"正在从多线程进程中创建CPU工作进程（当前 {threading.active_count()} 个线程），"
+                               f"建议在启动Web服务之前调用CPUWorkerPool.start()")
+            # 工作进程与主进程共用同一个资源跟踪进程，共享内存只由主进程负责删除
+            resource_tracker.ensure_running()
+            self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('fork'))
+            self.executor.submit(_noop).result()
+        else:
+            self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='cpu-worker')
+        logger.info(f"CPU工作池已启动: {'进程' if self.use_processes else '线程'}模式, {self.max_workers} 个工作者")
+
+    def shutdown(self) -> None:
+        """关闭工作池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, fn: Callable, *args, block: bool = True, timeout: Optional[float] = None,
+               shared: Optional[shared_memory.SharedMemory] = None) -> Optional[Future]:
+        """提交任务，队列已满且block为False（或等待超时）时丢弃任务并返回None
+
+        shared为任务使用的共享内存，任务结束或被丢弃后自动释放
+        """
+        if self.executor is None:
+            self.start()
+        if not self.pending.acquire(blocking=block, timeout=timeout if block else None):
+            with self.lock:
+                self.dropped_count += 1
+            _release_shared(shared)
+            return None
+
+        with self.lock:
+            self.pending_count += 1
+        try:
+            executor = self.executor
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # 有工作进程异常退出（例如超大页面耗尽内存）后执行器不再可用，重建后重试一次
+                future = self._restart(executor).submit(fn, *args)
+        except Exception:
+            self._task_done(shared)
+            raise
+        future.add_done_callback(lambda _: self._task_done(shared))
+        return future
+
+    def submit_batch(self, fn: Callable, *args) -> Future:
+        """提交批量任务，批量任务的名额用完时阻塞，不会占满实时捕获使用的队列"""
+        self.batch_pending.acquire()
+        try:
+            future = self.submit(fn, *args)
+        except Exception:
+            self.batch_pending.release()
+            raise
+        future.add_done_callback(lambda _: self.batch_pending.release())
+        return future
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None,
+            shared: Optional[shared_memory.SharedMemory] = None) -> Any:
+        """提交任务并等待结果，任务因工作进程崩溃而失败时重建工作池并重试一次"""
+        executor = self.executor
+        try:
+            future = self.submit(fn, *args)
+        except Exception:
+            _release_shared(shared)
+            raise
+        try:
+            return future.result(timeout)
+        except BrokenProcessPool:
+            self._restart(executor)
+            future = self.submit(fn, *args)
+            return future.result(timeout)
+        finally:
+            # 共享内存在重试之后才释放，最后一次提交的任务结束时删除
+            future.add_done_callback(lambda _: _release_shared(shared))
+
+    def share_image(self, image: Image.Image) -> Tuple[shared_memory.SharedMemory, Dict[str, Any]]:
+        """将截图像素复制到共享内存，返回(共享内存, 供工作者读取的句柄)"""
+        if image.mode not in SHAREABLE_MODES:
+            image = image.convert('RGB')
+        data = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        return shm, {'name': shm.name, 'mode': image.mode, 'size': image.size}
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取工作池状态"""
+        with self.lock:
+            return {
+                'mode': 'process' if self.use_processes else 'thread',
+                'workers': self.max_workers,
+                'pending': self.pending_count,
+                'max_pending': self.max_pending,
+                'dropped': self.dropped_count,
+                'restarts': self.restart_count
+            }
+
+    def _restart(self, broken) -> Any:
+        """替换已损坏的执行器，多个线程同时发现损坏时只重建一次"""
+        with self.restart_lock:
+            if self.executor is broken:
+                logger.warning("CPU工作池的工作进程异常退出，正在重建工作池")
+                try:
+                    broken.shutdown(wait=False, cancel_futures=True)
+                except Exception as e:
+                    logger.warning(f"关闭损坏的工作池失败: {str(e)}")
+                self.executor = None
+                # 此时Web服务线程已在运行，参见start中关于从多线程进程fork的说明
+                self.start()
+                with self.lock:
+                    self.restart_count += 1
+            return self.executor
+
+    def _task_done(self, shared: Optional[shared_memory.SharedMemory]) -> None:
+        """任务结束后释放共享内存和背压配额"""
+        _release_shared(shared)
+        with self.lock:
+            self.pending_count -= 1
+        self.pending.release()
+
+
+def _noop() -> None:
+    """预热工作进程"""
+    return None
+
+
+def _release_shared(shm: Optional[shared_memory.SharedMemory]) -> None:
+    """关闭并删除共享内存"""
+    if shm is None:
+        return
+    try:
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"释放共享内存失败: {str(e)}")
+
+
+def load_shared_image(handle: Optional[Dict[str, Any]]) -> Optional[Image.Image]:
+    """在工作者中从共享内存读取截图"""
+    if handle is None:
+        return None
+    shm = shared_memory.SharedMemory(name=handle['name'])
+    try:
+        width, height = handle['size']
+        size = width * height * len(handle['mode'])
+        return Image.frombytes(handle['mode'], tuple(handle['size']), bytes(shm.buf[:size]))
+    finally:
+        shm.close()
+
+
+def encode_image(image: Image.Image, image_format: str = 'PNG', max_dim: Optional[int] = None,
+                 quality: int = 85) -> bytes:
+    """编码截图，指定max_dim时按比例缩小到最长边不超过max_dim"""
+    width, height = image.size
+    if max_dim and (width > max_dim or height > max_dim):
+        if width > height:
+            new_width = max_dim
+            new_height = int(height * (max_dim / width))
+        else:
+            new_height = max_dim
+            new_width = int(width * (max_dim / height))
+        image = image.resize((new_width, new_height), Image.LANCZOS)
+
+    buffered = io.BytesIO()
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffered, 'JPEG', quality=quality, optimize=True)
+    else:
+        image.save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def encode_shared_image(handle: Dict[str, Any], image_format: str = 'PNG', max_dim: Optional[int] = None,
+                        quality: int = 85) -> bytes:
+    """工作者任务：编码共享内存中的截图"""
+    return encode_image(load_shared_image(handle), image_format, max_dim, quality)
+
+
+def parse_capture(xml_content: str) -> Tuple[Optional[list], Optional[str]]:
+    """工作者任务：解析层次结构XML，返回(node_data, tree_html)"""
+    from .ui_capturer import UICapturer
+    _, node_data, tree_html = UICapturer(None).parse_hierarchy(xml_content)
+    return node_data, tree_html
+
+
+def process_capture(xml_content: str, image_handle: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """工作者任务：完成一次捕获的全部CPU处理，包括解析、指纹计算和PNG编码"""
+    from .ui_capturer import UICapturer
+    from .screen_index import compute_image_hash, compute_structure_hash
+
+    root, node_data, tree_html = UICapturer(None).parse_hierarchy(xml_content)
+    screenshot = load_shared_image(image_handle)
+    return {
+        'node_data': node_data,
+        'tree_html': tree_html,
+        'structure_hash': compute_structure_hash(root),
+        'image_hash': compute_image_hash(screenshot),
+        'png': encode_image(screenshot, 'PNG') if screenshot is not None else None
+    }
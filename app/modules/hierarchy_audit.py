@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+# Android设计规范建议的最小触控尺寸为48dp，默认按mdpi(1px = 1dp)计算
+DEFAULT_MIN_TOUCH_SIZE = 48
+# 扫描重叠时每批处理的候选对数量上限，控制内存占用
+OVERLAP_BATCH_PAIRS = 1 << 20
+
+
+def simple_locator(node: Dict[str, Any]) -> str:
+    """生成与查看器“简单XPath”相同的定位符"""
+    attrs = node['attributes']
+    locator = f"//{node['tag']}"
+    if attrs.get('resource-id'):
+        locator += f'[@resource-id="{attrs["resource-id"]}"]'
+    elif attrs.get('text', '').strip():
+        locator += f'[@text="{attrs["text"].strip()}"]'
+    elif attrs.get('content-desc', '').strip():
+        locator += f'[@content-desc="{attrs["content-desc"].strip()}"]'
+    elif attrs.get('class'):
+        locator += f'[@class="{attrs["class"]}"]'
+    return locator
+
+
+def load_node_arrays(node_data: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """将节点bounds和标志位加载为NumPy数组"""
+    count = len(node_data)
+    bounds = np.zeros((count, 4), dtype=np.int64)
+    clickable = np.zeros(count, dtype=bool)
+    visible = np.ones(count, dtype=bool)
+    for i, node in enumerate(node_data):
+        b = node['bounds']
+        bounds[i] = (b['x1'], b['y1'], b['x2'], b['y2'])
+        attrs = node['attributes']
+        clickable[i] = attrs.get('clickable') == 'true' or attrs.get('long-clickable') == 'true'
+        visible[i] = attrs.get('visible-to-user', 'true') != 'false'
+    return {
+        'bounds': bounds,
+        'clickable': clickable,
+        'visible': visible,
+        'locators': np.array([simple_locator(node) for node in node_data], dtype=object)
+    }
+
+
+def find_overlapping_pairs(bounds: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """用按x1排序的扫描线找出所有部分重叠的矩形对，返回(下标a, 下标b, 重叠面积)
+
+    互相包含的矩形对（通常是父子容器）不计入
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(bounds) < 2:
+        return empty, empty, empty
+
+    order = np.argsort(bounds[:, 0], kind='stable')
+    sorted_bounds = bounds[order]
+    x1 = sorted_bounds[:, 0]
+    # 第i个矩形只需与x1落在[x1_i, x2_i)内的后续矩形比较
+    upper = np.searchsorted(x1, sorted_bounds[:, 2], side='left')
+    counts = np.maximum(upper - np.arange(len(bounds)) - 1, 0)
+
+    result_a, result_b, result_area = [], [], []
+    cumulative = np.cumsum(counts)
+    start = 0
+    while start < len(bounds):
+        # 按候选对数量分批，避免一次性生成过大的数组
+        done = int(cumulative[start - 1]) if start > 0 else 0
+        end = max(start + 1, int(np.searchsorted(cumulative, done + OVERLAP_BATCH_PAIRS, side='right')))
+        batch_counts = counts[start:end]
+        total = int(batch_counts.sum())
+        if total > 0:
+            first = np.repeat(np.arange(start, end), batch_counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(batch_counts) - batch_counts, batch_counts)
+            second = first + 1 + offsets
+
+            a = sorted_bounds[first]
+            b = sorted_bounds[second]
+            width = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+            height = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+            a_contains_b = (a[:, 0] <= b[:, 0]) & (a[:, 1] <= b[:, 1]) & (a[:, 2] >= b[:, 2]) & (a[:, 3] >= b[:, 3])
+            b_contains_a = (b[:, 0] <= a[:, 0]) & (b[:, 1] <= a[:, 1]) & (b[:, 2] >= a[:, 2]) & (b[:, 3] >= a[:, 3])
+            mask = (width > 0) & (height > 0) & ~a_contains_b & ~b_contains_a
+
+            result_a.append(order[first[mask]])
+            result_b.append(order[second[mask]])
+            result_area.append(width[mask] * height[mask])
+        start = end
+
+    if not result_a:
+        return empty, empty, empty
+    return np.concatenate(result_a), np.concatenate(result_b), np.concatenate(result_area)
+
+
+def audit_nodes(node_data: List[Dict[str, Any]], min_touch_size: int = DEFAULT_MIN_TOUCH_SIZE,
+                screen_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """对一次捕获的节点数据执行触控目标和重叠审计
+
+    screen_size为(宽, 高)，未提供时使用面积最大的节点（通常是窗口根布局）的右下角坐标
+    """
+    if not node_data:
+        return {'node_count': 0, 'clickable_count': 0, 'screen': None, 'issues': {}, 'summary': {}}
+
+    arrays = load_node_arrays(node_data)
+    bounds = arrays['bounds']
+    widths = bounds[:, 2] - bounds[:, 0]
+    heights = bounds[:, 3] - bounds[:, 1]
+
+    if screen_size is None:
+        largest = int(np.argmax(widths * heights))
+        screen_size = (int(bounds[largest, 2]), int(bounds[largest, 3]))
+    screen_width, screen_height = screen_size
+
+    targets = arrays['clickable'] & arrays['visible']
+    target_indices = np.flatnonzero(targets)
+
+    def describe(i: int) -> Dict[str, Any]:
+        node = node_data[i]
+        return {
+            'id': node['id'],
+            'stable_id': node.get('stable_id'),
+            'locator': arrays['locators'][i],
+            'bounds': node['bounds']
+        }
+
+    # 触控尺寸过小（不含面积为0的元素，它们归入屏幕外检查）
+    small = targets & ((widths < min_touch_size) | (heights < min_touch_size)) & (widths > 0) & (heights > 0)
+    small_targets = [dict(describe(i), width=int(widths[i]), height=int(heights[i])) for i in np.flatnonzero(small)]
+
+    # 完全或部分位于屏幕外、以及面积为0的可点击元素
+    fully_off = (bounds[:, 2] <= 0) | (bounds[:, 3] <= 0) | (bounds[:, 0] >= screen_width) | (bounds[:, 1] >= screen_height)
+    partially_off = (bounds[:, 0] < 0) | (bounds[:, 1] < 0) | (bounds[:, 2] > screen_width) | (bounds[:, 3] > screen_height)
+    degenerate = (widths <= 0) | (heights <= 0)
+    offscreen = targets & (fully_off | partially_off | degenerate)
+    offscreen_targets = [
+        dict(describe(i), fully_offscreen=bool(fully_off[i] or degenerate[i]))
+        for i in np.flatnonzero(offscreen)
+    ]
+
+    # 可点击元素之间的部分重叠
+    pair_a, pair_b, pair_area = find_overlapping_pairs(bounds[target_indices])
+    overlapping = [
+        {
+            'a': describe(int(target_indices[a])),
+            'b': describe(int(target_indices[b])),
+            'overlap_area': int(area)
+        }
+        for a, b, area in zip(pair_a, pair_b, pair_area)
+    ]
+
+    # 可点击元素的定位符同时匹配多个节点
+    duplicate_locators = []
+    unique_locators, inverse, counts = np.unique(arrays['locators'].astype(str), return_inverse=True, return_counts=True)
+    duplicated = counts[inverse] > 1
+    # 按定位符分组一次，之后每组直接切片
+    grouped = np.argsort(inverse, kind='stable')
+    group_starts = np.concatenate(([0], np.cumsum(counts)))
+    for group in np.unique(inverse[duplicated & targets]):
+        members = grouped[group_starts[group]:group_starts[group + 1]]
+        duplicate_locators.append({
+            'locator': str(unique_locators[group]),
+            'count': int(counts[group]),
+            'ids': [node_data[i]['id'] for i in members]
+        })
+
+    issues = {
+        'small_targets': small_targets,
+        'overlapping_clickables': overlapping,
+        'offscreen_clickables': offscreen_targets,
+        'duplicate_locators': duplicate_locators
+    }
+    return {
+        'node_count': len(node_data),
+        'clickable_count': int(targets.sum()),
+        'screen': {'width': screen_width, 'height': screen_height},
+        'min_touch_size': min_touch_size,
+        'issues': issues,
+        'summary': {name: len(items) for name, items in issues.items()}
+    }
+
+
+def audit_xml(xml_content: str, min_touch_size: int = DEFAULT_MIN_TOUCH_SIZE,
+              screen_size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """解析层次结构XML并审计，可作为工作池任务执行"""
+    from .ui_capturer import UICapturer
+    _, node_data, _ = UICapturer(None).parse_hierarchy(xml_content)
+    if node_data is None:
+        raise ValueError("解析UI层次结构失败")
+    return audit_nodes(node_data, min_touch_size, screen_size)
+
+
+def list_archive_dumps(path: str) -> List[str]:
+    """列出存档目录中的层次结构XML文件"""
+    return sorted(glob.glob(os.path.join(path, '**', '*.xml'), recursive=True))
+
+
+def merge_summaries(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """汇总多次捕获的问题数量"""
+    totals = {}
+    for result in results:
+        for name, count in result.get('summary', {}).items():
+            totals[name] = totals.get(name, 0) + count
+    return totals
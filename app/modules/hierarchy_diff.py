@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+ROOT_NODE_ID = 'node-0'
+
+
+def index_nodes(node_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """按位置ID建立节点索引，供差异比较时按children_ids直接定位子节点"""
+    return {node['id']: node for node in node_data}
+
+
+def diff_hierarchies(old_index: Dict[str, Dict[str, Any]], new_index: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """比较两次捕获的层次结构
+
+    从根节点开始按stable_id匹配子节点，subtree_hash相同的子树直接跳过，
+    因此耗时与发生变化的节点数量成正比，而不是与整棵树的大小成正比
+    """
+    result = {
+        'unchanged': True,
+        'added': [],
+        'removed': [],
+        'changed': [],
+        'visited': 0
+    }
+
+    old_root = old_index.get(ROOT_NODE_ID)
+    new_root = new_index.get(ROOT_NODE_ID)
+    if old_root is None or new_root is None:
+        if old_root is not None:
+            result['removed'].append(_summarize(old_root))
+        if new_root is not None:
+            result['added'].append(_summarize(new_root))
+        result['unchanged'] = old_root is None and new_root is None
+        return result
+
+    if old_root['stable_id'] != new_root['stable_id']:
+        # 根节点身份不同，视为整棵树替换
+        result['removed'].append(_summarize(old_root))
+        result['added'].append(_summarize(new_root))
+        result['unchanged'] = False
+        return result
+
+    stack = [(old_root, new_root)]
+    while stack:
+        old_node, new_node = stack.pop()
+        result['visited'] += 1
+        if old_node['subtree_hash'] == new_node['subtree_hash']:
+            continue
+
+        result['unchanged'] = False
+        changed_attrs = _diff_attributes(old_node['attributes'], new_node['attributes'])
+        if changed_attrs:
+            result['changed'].append({
+                'stable_id': new_node['stable_id'],
+                'old_id': old_node['id'],
+                'new_id': new_node['id'],
+                'attributes': changed_attrs
+            })
+
+        old_children = OrderedDict()
+        for child_id in old_node['children_ids']:
+            child = old_index.get(child_id)
+            if child is not None:
+                old_children[child['stable_id']] = child
+
+        for child_id in new_node['children_ids']:
+            child = new_index.get(child_id)
+            if child is None:
+                continue
+            old_child = old_children.pop(child['stable_id'], None)
+            if old_child is None:
+                result['added'].append(_summarize(child))
+            else:
+                stack.append((old_child, child))
+
+        for old_child in old_children.values():
+            result['removed'].append(_summarize(old_child))
+
+    return result
+
+
+def _diff_attributes(old_attrs: Dict[str, str], new_attrs: Dict[str, str]) -> Dict[str, List[Optional[str]]]:
+    """比较两个节点的属性，返回 {属性名: [旧值, 新值]}"""
+    changes = {}
+    for key in set(old_attrs) | set(new_attrs):
+        old_value = old_attrs.get(key)
+        new_value = new_attrs.get(key)
+        if old_value != new_value:
+            changes[key] = [old_value, new_value]
+    return changes
+
+
+def _summarize(node: Dict[str, Any]) -> Dict[str, Any]:
+    """生成新增或删除子树的摘要"""
+    return {
+        'stable_id': node['stable_id'],
+        'id': node['id'],
+        'class': node['attributes'].get('class', node['tag']),
+        'resource_id': node['attributes'].get('resource-id', '')
+    }
+
+
+class CaptureHistory:
+    """最近若干次捕获的节点索引，用于任意两次捕获之间的差异比较"""
+
+    def __init__(self, max_size: int = 50):
+        """初始化捕获历史"""
+        self.max_size = max_size
+        self.captures = OrderedDict()
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def add(self, node_data: List[Dict[str, Any]], timestamp: float) -> int:
+        """记录一次捕获，返回捕获ID"""
+        index = index_nodes(node_data)
+        with self.lock:
+            capture_id = self.next_id
+            self.next_id += 1
+            self.captures[capture_id] = {'index': index, 'timestamp': timestamp}
+            while len(self.captures) > self.max_size:
+                self.captures.popitem(last=False)
+            return capture_id
+
+    def latest_ids(self, count: int = 2) -> List[int]:
+        """获取最近count次捕获的ID，按时间从早到晚排列"""
+        with self.lock:
+            return list(self.captures.keys())[-count:]
+
+    def diff(self, base_id: int, target_id: int) -> Optional[Dict[str, Any]]:
+        """比较两次捕获，任一捕获已不在历史中时返回None"""
+        with self.lock:
+            base = self.captures.get(base_id)
+            target = self.captures.get(target_id)
+        if base is None or target is None:
+            return None
+        result = diff_hierarchies(base['index'], target['index'])
+        result['base'] = {'capture_id': base_id, 'timestamp': base['timestamp']}
+        result['target'] = {'capture_id': target_id, 'timestamp': target['timestamp']}
+        return result
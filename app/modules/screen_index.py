@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Tuple, Any, Optional
+from PIL import Image
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """计算两个整数哈希之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+def compute_image_hash(image: Optional[Image.Image]) -> int:
+    """计算截图的64位差值感知哈希(dHash)，无截图时返回0"""
+    if image is None:
+        return 0
+    # 缩放到9x8灰度图，比较水平相邻像素的明暗关系
+    small = image.convert('L').resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+
+def compute_structure_hash(root: Optional[ET.Element]) -> int:
+    """计算层次结构的64位SimHash，结构相近的界面哈希距离也相近"""
+    if root is None:
+        return 0
+    weights = [0] * HASH_BITS
+
+    def walk(node: ET.Element, path: str) -> None:
+        attrs = node.attrib
+        # 只使用类名和resource-id等结构特征，忽略文本和坐标等易变内容
+        token = f"{path}/{attrs.get('class', node.tag)}#{attrs.get('resource-id', '')}"
+        digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if (digest >> bit) & 1 else -1
+        for child in node:
+            walk(child, token)
+
+    walk(root, '')
+    value = 0
+    for bit in range(HASH_BITS):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+class BKTree:
+    """基于汉明距离的BK树，用于亚线性时间的近邻查询"""
+
+    def __init__(self):
+        """初始化BK树"""
+        self.root = None
+        self.size = 0
+
+    def add(self, key: int, value: Any) -> None:
+        """添加一个键值对"""
+        self.size += 1
+        if self.root is None:
+            # 节点结构: [key, [values], {distance: child}]
+            self.root = [key, [value], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """查找距离不超过max_distance的所有条目，返回(距离, 值)列表"""
+        results = []
+        if self.root is None:
+            return results
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(key, node[0])
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node[1])
+            # 三角不等式剪枝，只需访问距离在[d-r, d+r]范围内的子树
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return results
+
+
+class ScreenIndex:
+    """屏幕指纹索引，记录每次捕获的感知哈希和结构哈希，用于去重和相似屏幕查找"""
+
+    def __init__(self, index_path: Optional[str] = None, dedupe_distance: int = 4, flush_interval: float = 60.0):
+        """初始化屏幕索引，index_path不为空时从该文件加载并追加写入指纹
+
+        重复出现的屏幕只更新内存中的seen_count和last_seen，每隔flush_interval秒或调用flush时写入文件
+        """
+        self.index_path = index_path
+        self.dedupe_distance = dedupe_distance
+        self.flush_interval = flush_interval
+        self.entries = {}
+        self.tree = BKTree()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.dirty = set()
+        self.last_flush = time.time()
+        if index_path:
+            self.load(index_path)
+
+    @staticmethod
+    def combine_hashes(image_hash: int, structure_hash: int) -> int:
+        """将两个64位哈希拼接为128位键，拼接后的汉明距离即两者距离之和"""
+        return ((image_hash & HASH_MASK) << HASH_BITS) | (structure_hash & HASH_MASK)
+
+    def fingerprint(self, root: Optional[ET.Element], screenshot: Optional[Image.Image]) -> Tuple[int, int]:
+        """计算一次捕获的(感知哈希, 结构哈希)"""
+        return compute_image_hash(screenshot), compute_structure_hash(root)
+
+    def add(self, image_hash: int, structure_hash: int, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """直接添加一条指纹，返回屏幕ID"""
+        with self.lock:
+            return self._add_locked(image_hash, structure_hash, metadata or {})
+
+    def add_capture(self, root: Optional[ET.Element], screenshot: Optional[Image.Image],
+                    metadata: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+        """计算一次捕获的指纹并按add_fingerprint的规则入库，返回(屏幕ID, 是否为新屏幕)"""
+        image_hash, structure_hash = self.fingerprint(root, screenshot)
+        return self.add_fingerprint(image_hash, structure_hash, metadata)
+
+    def add_fingerprint(self, image_hash: int, structure_hash: int,
+                        metadata: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
+        """按已计算好的指纹入库，返回(屏幕ID, 是否为新屏幕)
+
+        距离不超过dedupe_distance的屏幕已存在时不重复入库，只累加其seen_count并更新last_seen
+        """
+        key = self.combine_hashes(image_hash, structure_hash)
+        with self.lock:
+            matches = self.tree.search(key, self.dedupe_distance)
+            if matches:
+                _, screen_id = min(matches)
+                entry = self.entries[screen_id]
+                entry['seen_count'] += 1
+                entry['last_seen'] = time.time()
+                # 自动捕获时同一屏幕会反复出现，计数变化只定期写入，避免文件随捕获次数增长
+                self.dirty.add(screen_id)
+                if entry['last_seen'] - self.last_flush >= self.flush_interval:
+                    self._flush_locked()
+                return screen_id, False
+            return self._add_locked(image_hash, structure_hash, metadata or {}), True
+
+    def find_similar(self, image_hash: int, structure_hash: int, max_distance: int = 10,
+                     limit: int = 20) -> List[Dict[str, Any]]:
+        """查找与给定指纹相似的屏幕，按距离从近到远排序"""
+        key = self.combine_hashes(image_hash, structure_hash)
+        with self.lock:
+            matches = self.tree.search(key, max_distance)
+            matches.sort()
+            return [dict(self.entries[screen_id], distance=distance) for distance, screen_id in matches[:limit]]
+
+    def find_similar_to(self, screen_id: str, max_distance: int = 10, limit: int = 20) -> List[Dict[str, Any]]:
+        """查找与已入库屏幕相似的其他屏幕"""
+        entry = self.get(screen_id)
+        if entry is None:
+            return []
+        results = self.find_similar(int(entry['image_hash'], 16), int(entry['structure_hash'], 16),
+                                    max_distance, limit + 1)
+        return [item for item in results if item['id'] != screen_id][:limit]
+
+    def get(self, screen_id: str) -> Optional[Dict[str, Any]]:
+        """获取屏幕条目"""
+        with self.lock:
+            entry = self.entries.get(screen_id)
+            return dict(entry) if entry else None
+
+    def update_metadata(self, screen_id: str, **metadata) -> bool:
+        """更新屏幕条目的元数据，例如保存后的文件路径"""
+        with self.lock:
+            entry = self.entries.get(screen_id)
+            if entry is None:
+                return False
+            entry['metadata'].update(metadata)
+            self._append_locked(entry)
+            self.dirty.discard(screen_id)
+            return True
+
+    def flush(self) -> None:
+        """将尚未写入的seen_count和last_seen更新追加到索引文件"""
+        with self.lock:
+            self._flush_locked()
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取索引状态"""
+        return {
+            'size': len(self.entries),
+            'index_path': self.index_path,
+            'dedupe_distance': self.dedupe_distance
+        }
+
+    def load(self, index_path: str) -> int:
+        """从JSON Lines文件加载指纹，同ID的后续记录覆盖先前记录"""
+        if not os.path.exists(index_path):
+            return 0
+        loaded = {}
+        line_count = 0
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    line_count += 1
+                    try:
+                        entry = json.loads(line)
+                        loaded[entry['id']] = entry
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"跳过无效的屏幕索引记录: {str(e)}")
+        except Exception as e:
+            logger.error(f"加载屏幕索引失败: {str(e)}")
+            return 0
+
+        with self.lock:
+            for screen_id, entry in loaded.items():
+                if screen_id not in self.entries:
+                    key = self.combine_hashes(int(entry['image_hash'], 16), int(entry['structure_hash'], 16))
+                    self.tree.add(key, screen_id)
+                self.entries[screen_id] = entry
+            self.next_id = len(self.entries)
+            # 同ID的旧记录超过有效记录数时重写文件，每个ID只保留一条
+            if index_path == self.index_path and line_count > len(loaded) * 2:
+                self._compact_locked()
+        logger.info(f"已加载屏幕索引: {len(loaded)} 条记录")
+        return len(loaded)
+
+    def _add_locked(self, image_hash: int, structure_hash: int, metadata: Dict[str, Any]) -> str:
+        """在持有锁的情况下添加指纹"""
+        screen_id = f"screen-{self.next_id}"
+        while screen_id in self.entries:
+            self.next_id += 1
+            screen_id = f"screen-{self.next_id}"
+        self.next_id += 1
+
+        now = time.time()
+        entry = {
+            'id': screen_id,
+            'image_hash': f"{image_hash:016x}",
+            'structure_hash': f"{structure_hash:016x}",
+            'first_seen': now,
+            'last_seen': now,
+            'seen_count': 1,
+            'metadata': metadata
+        }
+        self.entries[screen_id] = entry
+        self.tree.add(self.combine_hashes(image_hash, structure_hash), screen_id)
+        self._append_locked(entry)
+        return screen_id
+
+    def _flush_locked(self) -> None:
+        """在持有锁的情况下写入待更新的条目"""
+        for screen_id in self.dirty:
+            self._append_locked(self.entries[screen_id])
+        self.dirty.clear()
+        self.last_flush = time.time()
+
+    def _compact_locked(self) -> None:
+        """在持有锁的情况下重写索引文件，先写入临时文件再替换，避免中途失败丢失索引"""
+        temp_path = self.index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(temp_path, self.index_path)
+            self.dirty.clear()
+            logger.info(f"已压缩屏幕索引: {len(self.entries)} 条记录")
+        except Exception as e:
+            logger.error(f"压缩屏幕索引失败: {str(e)}")
+
+    def _append_locked(self, entry: Dict[str, Any]) -> None:
+        """将条目追加写入索引文件"""
+        if not self.index_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.error(f"写入屏幕索引失败: {str(e)}")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Tuple, Any, Optional, Callable
+from PIL import Image
+
+from .device_manager import DeviceManager
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+
+class ScreenStreamer:
+    """屏幕流，独立于层次结构捕获持续拉取截图，并保留最近的若干帧供层次结构标记使用"""
+
+    def __init__(self, device_manager: DeviceManager, max_frames: int = 30, jpeg_quality: int = 70):
+        """初始化屏幕流"""
+        self.device_manager = device_manager
+        self.jpeg_quality = jpeg_quality
+        self.fps = 10
+        self.enabled = False
+        self.thread = None
+        self.frames = deque(maxlen=max_frames)
+        self.next_seq = 1
+        self.lock = threading.Lock()
+        self.frame_callbacks = []
+        self.stop_callbacks = []
+        self.last_error = None
+
+    def add_frame_callback(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """添加新帧回调函数"""
+        self.frame_callbacks.append(callback)
+
+    def remove_frame_callback(self, callback: Callable) -> None:
+        """移除新帧回调函数"""
+        if callback in self.frame_callbacks:
+            self.frame_callbacks.remove(callback)
+
+    def add_stop_callback(self, callback: Callable[[], None]) -> None:
+        """添加推流停止回调函数，无论是调用stop还是设备断开导致的停止都会调用"""
+        self.stop_callbacks.append(callback)
+
+    def start(self, fps: float = 10) -> bool:
+        """开始推流，帧率限制在1-15之间，设备截图较慢时以设备能达到的最快速度推流"""
+        self.fps = max(1, min(fps, 15))
+        if self.enabled:
+            return True
+
+        if not self.device_manager.connected:
+            logger.error("未连接设备")
+            self.last_error = "未连接设备"
+            return False
+
+        # 上次推流留下的帧已过时，不能再用于标记新的捕获
+        self.clear_frames()
+        self.enabled = True
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"屏幕流已启动, 目标帧率: {self.fps}fps")
+        return True
+
+    def stop(self) -> bool:
+        """停止推流"""
+        if not self.enabled:
+            return True
+        self.enabled = False
+        if self.thread and self.thread.is_alive():
+            self.thread.join(1)
+        self.thread = None
+        self.clear_frames()
+        logger.info("屏幕流已停止")
+        self._notify_stopped()
+        return True
+
+    def clear_frames(self) -> None:
+        """清空缓存的帧"""
+        with self.lock:
+            self.frames.clear()
+
+    def get_latest_frame(self) -> Optional[Dict[str, Any]]:
+        """获取最新一帧"""
+        with self.lock:
+            return self.frames[-1] if self.frames else None
+
+    def find_nearest_frame(self, timestamp: float) -> Optional[Dict[str, Any]]:
+        """获取时间上最接近timestamp的帧"""
+        with self.lock:
+            if not self.frames:
+                return None
+            return min(self.frames, key=lambda frame: abs(frame['timestamp'] - timestamp))
+
+    def nearest_frame_image(self, timestamp: float, window: float = 0.0) -> Optional[Tuple[int, Image.Image]]:
+        """获取最接近timestamp的帧并解码，返回(帧序号, 截图)
+
+        window为层次结构dump的耗时，与timestamp相差超过max(两帧间隔, window)的帧视为过时；
+        未在推流或没有足够新的帧（例如设备截图持续失败）时返回None，由调用方直接截图
+        """
+        if not self.enabled:
+            return None
+        frame = self.find_nearest_frame(timestamp)
+        if frame is None:
+            return None
+        if abs(frame['timestamp'] - timestamp) > max(2.0 / self.fps, window):
+            return None
+        with Image.open(io.BytesIO(frame['data'])) as img:
+            return frame['seq'], img.copy()
+
+    def get_actual_fps(self) -> Optional[float]:
+        """按最近几秒内成功获取的帧计算实际帧率，截图持续失败时降为0"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        window = max(2.0, 3.0 / self.fps)
+        with self.lock:
+            recent = [frame['timestamp'] for frame in self.frames if now - frame['timestamp'] <= window]
+        if len(recent) < 2 or recent[-1] <= recent[0]:
+            return 0.0
+        return round(min(self.fps, (len(recent) - 1) / (recent[-1] - recent[0])), 1)
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取推流状态"""
+        latest = self.get_latest_frame()
+        return {
+            'enabled': self.enabled,
+            'fps': self.fps,
+            'actual_fps': self.get_actual_fps(),
+            'last_seq': latest['seq'] if latest else None,
+            'error': self.last_error
+        }
+
+    def _notify_stopped(self) -> None:
+        """调用推流停止回调"""
+        for callback in self.stop_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"执行推流停止回调时出错: {str(e)}")
+
+    def _grab(self) -> Tuple[bytes, str]:
+        """从设备获取一帧，优先使用设备直接返回的编码数据，避免解码再编码"""
+        device = self.device_manager.device
+        data = device.screenshot(format='raw')
+        if isinstance(data, (bytes, bytearray)):
+            if data[:2] == b'\xff\xd8':
+                return bytes(data), 'image/jpeg'
+            if data[:8] == b'\x89PNG\r\n\x1a\n':
+                return bytes(data), 'image/png'
+            with Image.open(io.BytesIO(data)) as img:
+                data = img.copy()
+
+        image = data if data.mode in ('RGB', 'L') else data.convert('RGB')
+        buffered = io.BytesIO()
+        image.save(buffered, 'JPEG', quality=self.jpeg_quality)
+        return buffered.getvalue(), 'image/jpeg'
+
+    def _run(self) -> None:
+        """推流线程"""
+        while self.enabled:
+            started = time.time()
+            if not self.device_manager.connected or not self.device_manager.device:
+                self.last_error = "未连接设备"
+                self.enabled = False
+                self.clear_frames()
+                logger.warning("设备已断开，屏幕流已停止")
+                self._notify_stopped()
+                break
+            try:
+                data, mimetype = self._grab()
+                now = time.time()
+                with self.lock:
+                    frame = {'seq': self.next_seq, 'timestamp': now, 'data': data, 'mimetype': mimetype}
+                    self.next_seq += 1
+                    self.frames.append(frame)
+                self.last_error = None
+
+                for callback in self.frame_callbacks:
+                    try:
+                        callback(frame)
+                    except Exception as e:
+                        logger.error(f"执行帧回调时出错: {str(e)}")
+            except Exception as e:
+                logger.error(f"获取屏幕帧失败: {str(e)}")
+                self.last_error = str(e)
+                time.sleep(0.5)
+
+            time.sleep(max(0, 1.0 / self.fps - (time.time() - started)))
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import mmap
+import json
+import zlib
+import struct
+import logging
+import threading
+from typing import List, Dict, Tuple, Any, Optional
+from PIL import Image
+
+logger = logging.getLogger('XmlViewer.Modules')
+
+# 文件格式:
+#   文件头   FILE_MAGIC
+#   帧记录   FRAME_HEADER + zlib压缩的XML + 编码后的截图 + JSON元数据，逐帧追加
+#   索引尾部 每帧一条INDEX_ENTRY + TRAILER(索引偏移, 帧数, INDEX_MAGIC)
+# 录制中断时没有索引尾部，读取时顺序扫描帧头重建索引
+FILE_MAGIC = b'UICSESS1'
+FRAME_MAGIC = b'FRM0'
+INDEX_MAGIC = b'UICSIDX1'
+FRAME_HEADER = struct.Struct('<4sdIII')   # magic, timestamp, xml_len, img_len, meta_len
+INDEX_ENTRY = struct.Struct('<QdIII')     # frame_offset, timestamp, xml_len, img_len, meta_len
+TRAILER = struct.Struct('<QI8s')          # index_offset, frame_count, magic
+
+
+class SessionRecorder:
+    """会话录制器，将每次捕获追加写入单个带索引尾部的会话文件"""
+
+    def __init__(self, image_format: str = 'PNG', compress_level: int = 6):
+        """初始化会话录制器"""
+        self.image_format = image_format
+        self.compress_level = compress_level
+        self.path = None
+        self.file = None
+        self.index = []
+        self.lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        """是否正在录制"""
+        return self.file is not None
+
+    def start(self, path: str) -> bool:
+        """开始录制到指定文件，文件已存在时在其末尾继续追加"""
+        with self.lock:
+            if self.file is not None:
+                logger.warning(f"会话录制已在运行: {self.path}")
+                return True
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                if os.path.exists(path) and os.path.getsize(path) > 0:
+                    self.index = _read_index(path)
+                    self.file = open(path, 'r+b')
+                    # 去掉旧的索引尾部，新帧从最后一帧之后继续写入
+                    self.file.seek(_frames_end(self.index))
+                    self.file.truncate()
+                else:
+                    self.index = []
+                    self.file = open(path, 'wb')
+                    self.file.write(FILE_MAGIC)
+                    self.file.flush()
+                self.path = path
+                logger.info(f"会话录制已启动: {path}, 已有 {len(self.index)} 帧")
+                return True
+            except Exception as e:
+                logger.error(f"启动会话录制失败: {str(e)}")
+                if self.file is not None:
+                    self.file.close()
+                self.file = None
+                self.index = []
+                return False
+
+    def stop(self) -> bool:
+        """停止录制并写入索引尾部"""
+        with self.lock:
+            if self.file is None:
+                logger.warning("会话录制未在运行")
+                return True
+            try:
+                index_offset = self.file.tell()
+                for entry in self.index:
+                    self.file.write(INDEX_ENTRY.pack(*entry))
+                self.file.write(TRAILER.pack(index_offset, len(self.index), INDEX_MAGIC))
+                self.file.close()
+                logger.info(f"会话录制已停止: {self.path}, 共 {len(self.index)} 帧")
+                return True
+            except Exception as e:
+                logger.error(f"停止会话录制失败: {str(e)}")
+                return False
+            finally:
+                self.file = None
+
+    def add_frame(self, xml_content: str, screenshot: Optional[Image.Image],
+                  metadata: Optional[Dict[str, Any]] = None, timestamp: float = 0.0,
+                  image_bytes: Optional[bytes] = None) -> int:
+        """追加一帧，返回帧序号，未在录制时返回-1
+
+        image_bytes为已按image_format编码好的截图，提供时不再重复编码
+        """
+        xml_bytes = zlib.compress((xml_content or '').encode('utf-8'), self.compress_level)
+        img_bytes = b''
+        if image_bytes is not None:
+            img_bytes = image_bytes
+        elif screenshot is not None:
+            buffered = io.BytesIO()
+            screenshot.save(buffered, format=self.image_format)
+            img_bytes = buffered.getvalue()
+        meta_bytes = json.dumps(metadata or {}, ensure_ascii=False).encode('utf-8')
+
+        with self.lock:
+            if self.file is None:
+                return -1
+            offset = self.file.tell()
+            self.file.write(FRAME_HEADER.pack(FRAME_MAGIC, timestamp, len(xml_bytes), len(img_bytes), len(meta_bytes)))
+            self.file.write(xml_bytes)
+            self.file.write(img_bytes)
+            self.file.write(meta_bytes)
+            self.file.flush()
+            self.index.append((offset, timestamp, len(xml_bytes), len(img_bytes), len(meta_bytes)))
+            return len(self.index) - 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取录制状态"""
+        return {
+            'recording': self.recording,
+            'path': self.path,
+            'frame_count': len(self.index),
+            'image_format': self.image_format
+        }
+
+
+class SessionReader:
+    """会话读取器，通过内存映射按帧序号O(1)随机访问会话文件"""
+
+    def __init__(self, path: str, live: bool = False):
+        """打开会话文件并加载帧索引，live表示文件仍在录制中"""
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = _parse_index(self.mmap, live)
+
+    def refresh(self, live: bool = False) -> int:
+        """文件大小变化（仍在录制）后重新映射，只扫描上次已知的最后一帧之后新增的帧，返回新增帧数
+
+        旧的内存映射可能仍被其他线程使用，不主动关闭，先替换映射再替换索引，
+        保证任何线程读到的索引都不会超出它所用映射的范围
+        """
+        with self.lock:
+            size = os.fstat(self.file.fileno()).st_size
+            if size == self.size:
+                return 0
+            mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            end = _frames_end(self.index)
+            if end <= size:
+                index = self.index + _scan_frames(mapped, end)
+            else:
+                index = _parse_index(mapped, live)
+            added = len(index) - len(self.index)
+            self.mmap = mapped
+            self.index = index
+            self.size = size
+            return added
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """关闭会话文件"""
+        if getattr(self, 'mmap', None) is not None:
+            self.mmap.close()
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+
+    def frame_info(self) -> List[Dict[str, Any]]:
+        """获取所有帧的时间戳和大小，不读取帧内容"""
+        return [
+            {'frame': i, 'timestamp': entry[1], 'xml_size': entry[2], 'image_size': entry[3]}
+            for i, entry in enumerate(self.index)
+        ]
+
+    def find_frame(self, timestamp: float) -> int:
+        """二分查找不晚于指定时间戳的最后一帧"""
+        low, high = 0, len(self.index)
+        while low < high:
+            mid = (low + high) // 2
+            if self.index[mid][1] <= timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return max(0, low - 1)
+
+    def get_xml(self, frame: int) -> str:
+        """读取指定帧的XML"""
+        offset, _, xml_len, _, _ = self.index[frame]
+        start = offset + FRAME_HEADER.size
+        return zlib.decompress(self.mmap[start:start + xml_len]).decode('utf-8')
+
+    def get_image_bytes(self, frame: int) -> bytes:
+        """读取指定帧的已编码截图，无截图时返回空字节串"""
+        offset, _, xml_len, img_len, _ = self.index[frame]
+        start = offset + FRAME_HEADER.size + xml_len
+        return self.mmap[start:start + img_len]
+
+    def get_image(self, frame: int) -> Optional[Image.Image]:
+        """读取指定帧的截图"""
+        img_bytes = self.get_image_bytes(frame)
+        if not img_bytes:
+            return None
+        with Image.open(io.BytesIO(img_bytes)) as img:
+            return img.copy()
+
+    def get_metadata(self, frame: int) -> Dict[str, Any]:
+        """读取指定帧的元数据"""
+        offset, timestamp, xml_len, img_len, meta_len = self.index[frame]
+        start = offset + FRAME_HEADER.size + xml_len + img_len
+        metadata = json.loads(self.mmap[start:start + meta_len].decode('utf-8')) if meta_len else {}
+        metadata.setdefault('timestamp', timestamp)
+        return metadata
+
+
+def _frames_end(index: List[Tuple[int, float, int, int, int]]) -> int:
+    """计算最后一帧结束的位置"""
+    if not index:
+        return len(FILE_MAGIC)
+    offset, _, xml_len, img_len, meta_len = index[-1]
+    return offset + FRAME_HEADER.size + xml_len + img_len + meta_len
+
+
+def _read_index(path: str) -> List[Tuple[int, float, int, int, int]]:
+    """读取会话文件的帧索引"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return _parse_index(mapped)
+
+
+def _parse_index(data, live: bool = False) -> List[Tuple[int, float, int, int, int]]:
+    """从索引尾部解析帧索引，尾部缺失或损坏时顺序扫描帧头重建
+
+    live表示文件仍在录制中，此时没有索引尾部是正常情况
+    """
+    size = len(data)
+    if size < len(FILE_MAGIC) or data[:len(FILE_MAGIC)] != FILE_MAGIC:
+        raise ValueError("不是有效的会话文件")
+
+    if size >= len(FILE_MAGIC) + TRAILER.size:
+        index_offset, frame_count, magic = TRAILER.unpack_from(data, size - TRAILER.size)
+        if magic == INDEX_MAGIC and index_offset + frame_count * INDEX_ENTRY.size + TRAILER.size == size:
+            return [INDEX_ENTRY.unpack_from(data, index_offset + i * INDEX_ENTRY.size) for i in range(frame_count)]
+
+    if live:
+        logger.debug("会话文件仍在录制，扫描帧数据建立索引")
+    else:
+        logger.warning("会话文件缺少索引尾部，正在扫描帧数据重建索引")
+    return _scan_frames(data, len(FILE_MAGIC))
+
+
+def _scan_frames(data, offset: int) -> List[Tuple[int, float, int, int, int]]:
+    """从offset开始顺序扫描帧头，遇到不完整的帧或索引尾部时停止"""
+    size = len(data)
+    index = []
+    while offset + FRAME_HEADER.size <= size:
+        magic, timestamp, xml_len, img_len, meta_len = FRAME_HEADER.unpack_from(data, offset)
+        end = offset + FRAME_HEADER.size + xml_len + img_len + meta_len
+        if magic != FRAME_MAGIC or end > size:
+            break
+        index.append((offset, timestamp, xml_len, img_len, meta_len))
+        offset = end
+    return index
@@ -5,6 +5,7 @@ import os
 import io
 import time
 import traceback
+import hashlib
 import logging
 import xml.etree.ElementTree as ET
 from datetime import datetime
@@ -29,6 +30,9 @@ class UICapturer:
         self.auto_capture_interval = 3
         self.auto_capture_thread = None
         self.capture_callbacks = []
+        # 可选的帧来源，接收时间戳并返回(帧序号, 截图)
+        self.frame_source = None
+        self.last_frame_seq = None
     
     def add_capture_callback(self, callback: Callable[[str, Optional[Image.Image]], None]) -> None:
         """添加捕获回调函数"""
@@ -50,54 +54,20 @@ class UICapturer:
             logger.info("正在捕获UI")
             device = self.device_manager.device
             # 捕获XML
+            dump_started = time.time()
             xml_content = device.dump_hierarchy()
+            dump_finished = time.time()
             self.last_xml = xml_content
             
-            # 修改截图方式：先保存为临时文件，再读取
-            import tempfile
-            import os
-            
-            # 创建临时文件
-            temp_file = None
-            try:
-                # 使用with语句确保文件正确关闭
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                    temp_png = tmp.name
-                    temp_file = temp_png
-                
-                # 保存截图到关闭后的临时文件
-                device.screenshot(temp_png)
-                
-                # 读取截图，使用新的Image对象
-                if os.path.exists(temp_png):
-                    # 使用try-finally确保文件被关闭
-                    try:
-                        with Image.open(temp_png) as img:
-                            # 创建一个新的副本，避免文件锁定
-                            self.last_screenshot = img.copy()
-                        logger.info(f"截图保存为临时文件并成功读取: {temp_png}")
-                    except Exception as e:
-                        logger.error(f"读取截图文件时出错: {str(e)}")
-                        self.last_screenshot = None
-                else:
-                    logger.error(f"截图文件未创建: {temp_png}")
-                    self.last_screenshot = None
-            finally:
-                # 清理临时文件，使用延迟和重试机制
-                if temp_file and os.path.exists(temp_file):
-                    retry_count = 3
-                    while retry_count > 0:
-                        try:
-                            os.unlink(temp_file)
-                            break
-                        except Exception as e:
-                            retry_count -= 1
-                            logger.warning(f"清理临时截图文件失败（剩余尝试：{retry_count}）: {str(e)}")
-                            # 等待一小段时间再尝试删除
-                            time.sleep(0.5)
-                    
-                    if retry_count == 0:
-                        logger.warning(f"无法清理临时文件: {temp_file}，将在程序退出时自动清理")
+            # 屏幕流运行时使用与层次结构最接近的帧，省去一次设备截图；没有足够新的帧时仍直接截图
+            frame = None
+            if self.frame_source:
+                frame = self.frame_source((dump_started + dump_finished) / 2, dump_finished - dump_started)
+            if frame is not None:
+                self.last_frame_seq, self.last_screenshot = frame
+            else:
+                self.last_frame_seq = None
+                self._capture_screenshot(device)
             
             self.last_capture_time = time.time()
             self.last_error = None
@@ -116,6 +86,54 @@ class UICapturer:
             self.last_error = str(e)
             return False
     
+    def _capture_screenshot(self, device) -> None:
+        """从设备截图并保存到last_screenshot"""
+        # 修改截图方式：先保存为临时文件，再读取
+        import tempfile
+        import os
+        
+        # 创建临时文件
+        temp_file = None
+        try:
+            # 使用with语句确保文件正确关闭
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
+                temp_png = tmp.name
+                temp_file = temp_png
+            
+            # 保存截图到关闭后的临时文件
+            device.screenshot(temp_png)
+            
+            # 读取截图，使用新的Image对象
+            if os.path.exists(temp_png):
+                # 使用try-finally确保文件被关闭
+                try:
+                    with Image.open(temp_png) as img:
+                        # 创建一个新的副本，避免文件锁定
+                        self.last_screenshot = img.copy()
+                    logger.info(f"截图保存为临时文件并成功读取: {temp_png}")
+                except Exception as e:
+                    logger.error(f"读取截图文件时出错: {str(e)}")
+                    self.last_screenshot = None
+            else:
+                logger.error(f"截图文件未创建: {temp_png}")
+                self.last_screenshot = None
+        finally:
+            # 清理临时文件，使用延迟和重试机制
+            if temp_file and os.path.exists(temp_file):
+                retry_count = 3
+                while retry_count > 0:
+                    try:
+                        os.unlink(temp_file)
+                        break
+                    except Exception as e:
+                        retry_count -= 1
+                        logger.warning(f"清理临时截图文件失败（剩余尝试：{retry_count}）: {str(e)}")
+                        # 等待一小段时间再尝试删除
+                        time.sleep(0.5)
+                
+                if retry_count == 0:
+                    logger.warning(f"无法清理临时文件: {temp_file}，将在程序退出时自动清理")
+    
     def start_auto_capture(self, interval: int = 3) -> bool:
         """开始自动捕获"""
         if self.auto_capture_enabled:
@@ -179,6 +197,7 @@ class UICapturer:
             'last_capture_time': self.last_capture_time,
             'has_screenshot': self.last_screenshot is not None,
             'has_xml': self.last_xml is not None,
+            'last_frame_seq': self.last_frame_seq,
             'error': self.last_error
         }
     
@@ -200,13 +219,30 @@ class UICapturer:
             traceback.print_exc()
             return None, None, None
     
-    def _extract_node_data(self, node: ET.Element, current_id_parts: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        """递归提取节点数据，并使用基于路径的ID (e.g., node-0, node-0-0, node-0-1)"""
+    @staticmethod
+    def _node_identity_key(node: ET.Element) -> str:
+        """节点身份键，由class和resource-id组成，不受兄弟节点位置影响"""
+        return f"{node.attrib.get('class', node.tag)}#{node.attrib.get('resource-id', '')}"
+
+    @staticmethod
+    def _short_hash(content: str) -> str:
+        """计算16位十六进制的内容哈希"""
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+    def _extract_node_data(self, node: ET.Element, current_id_parts: Optional[List[str]] = None,
+                           stable_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """递归提取节点数据，并使用基于路径的ID (e.g., node-0, node-0-0, node-0-1)
+
+        同时自底向上计算每个节点的子树内容哈希(subtree_hash)，以及由祖先、class和
+        resource-id推导出的稳定ID(stable_id)，插入兄弟节点时其他节点的stable_id保持不变
+        """
         result = []
 
         if current_id_parts is None:
             # 这是根节点
             current_id_parts = ["0"]
+        if stable_path is None:
+            stable_path = self._node_identity_key(node) + "[0]"
         
         node_id = "node-" + "-".join(current_id_parts)
         
@@ -243,12 +279,27 @@ class UICapturer:
         node_data_entry['type'] = node_type
         node_data_entry['childCount'] = len(node)
         
+        node_data_entry['stable_id'] = "s-" + self._short_hash(stable_path)
+        
         result.append(node_data_entry)
         
+        # 同一父节点下相同身份键的兄弟节点按出现顺序编号
+        key_counts = {}
+        child_hashes = []
         for i, child_element in enumerate(node):
             child_id_parts = current_id_parts + [str(i)]
             node_data_entry['children_ids'].append("node-" + "-".join(child_id_parts))
-            result.extend(self._extract_node_data(child_element, child_id_parts))
+            child_key = self._node_identity_key(child_element)
+            occurrence = key_counts.get(child_key, 0)
+            key_counts[child_key] = occurrence + 1
+            child_result = self._extract_node_data(child_element, child_id_parts,
+                                                   f"{stable_path}/{child_key}[{occurrence}]")
+            child_hashes.append(child_result[0]['subtree_hash'])
+            result.extend(child_result)
+        
+        # 子树哈希 = 自身标签和属性 + 按顺序排列的子节点子树哈希
+        own_content = node.tag + "\0" + "\0".join(f"{k}={v}" for k, v in sorted(attrs.items()))
+        node_data_entry['subtree_hash'] = self._short_hash(own_content + "\0" + ",".join(child_hashes))
             
         return result
     
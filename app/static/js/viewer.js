@@ -19,6 +19,10 @@ let isDeepSelectionMode = true; // 默认开启深层选择
 let socket = null;  // WebSocket连接
 let isConnected = false;  // 设备连接状态
 let isCapturing = false;  // 是否正在自动捕获
+let sessionFrameTimer = null;  // 会话回放滑块的防抖定时器
+let isStreaming = false;  // 是否订阅了实时屏幕流
+let lastStreamFrameTime = 0;  // 最近收到屏幕流帧的时间
+const STREAM_STALE_MS = 2000;  // 超过此时间没有收到帧时，截图改由捕获结果更新
 
 // DOM 元素引用
 let deviceList = null;
@@ -301,6 +305,13 @@ function createExampleElements(parentElement) {
 function renderAllElements() {
     const contentWrapper = document.getElementById('contentWrapper');
     contentWrapper.innerHTML = '';
+    
+    // 画布渲染模式下不创建DOM元素
+    if (isCanvasMode()) {
+        renderCanvasOverlay();
+        return;
+    }
+    setOverlayCanvasVisible(false);
     console.log("开始渲染UI元素...");
     
     let addedElements = 0;
@@ -412,8 +423,362 @@ function addElementToScreen(node) {
     }
 }
 
+// ==================== 画布渲染模式 ====================
+// 所有元素框绘制在两层画布上：底层绘制全部元素框，顶层只绘制选中和悬停的元素，
+// 选中和悬停变化时只重绘顶层中发生变化的区域，避免为每个节点创建DOM元素
+
+// 元素框颜色，与style.css中.ui-element的边框颜色一致
+const OVERLAY_TYPE_CODES = { 'default': 0, 'clickable': 1, 'image': 2, 'text': 3 };
+const OVERLAY_STROKES = [
+    'rgba(33, 150, 243, 0.9)',
+    'rgba(255, 152, 0, 0.9)',
+    'rgba(156, 39, 176, 0.9)',
+    'rgba(3, 169, 244, 0.7)'
+];
+// 子节点较多的大容器降低不透明度，与addElementToScreen一致
+const OVERLAY_ALPHAS = [1, 0.75, 0.5];
+
+let overlayBounds = new Float32Array(0);  // 每个节点4个值: x1, y1, x2, y2（画布坐标）
+let overlayAreas = new Float32Array(0);   // 每个节点在设备坐标中的面积
+let overlayVisible = new Uint8Array(0);   // 1: 绘制, 0: 不绘制
+let overlayBuckets = [];                  // 按 透明度 * 4 + 类型 分组的节点下标
+let overlayNodeIds = [];
+let overlayIndexById = new Map();
+let overlaySelectedIndex = -1;
+let overlayHoverIndex = -1;
+let overlayDirtyRects = [];               // 顶层画布上一次绘制的区域
+let overlayHoverFrame = null;
+
+// 是否使用画布渲染模式
+function isCanvasMode() {
+    const checkbox = document.getElementById('canvasMode');
+    return !!(checkbox && checkbox.checked);
+}
+
+// 切换画布/DOM渲染模式
+function toggleCanvasMode() {
+    console.log(`画布渲染模式: ${isCanvasMode() ? '开启' : '关闭'}`);
+    renderAllElements();
+    setTimeout(initClickHandlers, 100);
+    if (selectedNodeId) {
+        highlightElement(selectedNodeId);
+    }
+}
+
+// 显示/隐藏两层画布
+function setOverlayCanvasVisible(visible) {
+    ['overlayBaseCanvas', 'overlayTopCanvas'].forEach(id => {
+        const canvas = document.getElementById(id);
+        if (canvas) {
+            canvas.style.display = visible ? 'block' : 'none';
+        }
+    });
+}
+
+// 按手机屏幕大小和设备像素比调整画布尺寸，返回绘图上下文
+function prepareOverlayCanvas(canvas) {
+    const ratio = window.devicePixelRatio || 1;
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    if (canvas.width !== Math.round(width * ratio) || canvas.height !== Math.round(height * ratio)) {
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+    return ctx;
+}
+
+// 将节点bounds复制到扁平的类型化数组，坐标按当前缩放转换为画布坐标
+function buildOverlayArrays() {
+    const count = nodeData.length;
+    overlayBounds = new Float32Array(count * 4);
+    overlayAreas = new Float32Array(count);
+    overlayVisible = new Uint8Array(count);
+    overlayNodeIds = new Array(count);
+    overlayIndexById = new Map();
+    overlaySelectedIndex = -1;
+    overlayHoverIndex = -1;
+    
+    const bucketLists = [];
+    for (let i = 0; i < OVERLAY_ALPHAS.length * 4; i++) {
+        bucketLists.push([]);
+    }
+    
+    for (let i = 0; i < count; i++) {
+        const node = nodeData[i];
+        const b = node.bounds;
+        const width = b.x2 - b.x1;
+        const height = b.y2 - b.y1;
+        overlayNodeIds[i] = node.id;
+        overlayIndexById.set(node.id, i);
+        
+        overlayBounds[i * 4] = (b.x1 - contentMinX) * baseScale + initialTranslateX;
+        overlayBounds[i * 4 + 1] = (b.y1 - contentMinY) * baseScale + initialTranslateY;
+        overlayBounds[i * 4 + 2] = (b.x2 - contentMinX) * baseScale + initialTranslateX;
+        overlayBounds[i * 4 + 3] = (b.y2 - contentMinY) * baseScale + initialTranslateY;
+        overlayAreas[i] = width * height;
+        
+        // 与addElementToScreen相同的过滤规则
+        if (width <= 0 || height <= 0) continue;
+        if (node.id === "0" && (width > 1080 * 1.05 || height > 2400 * 1.05)) continue;
+        overlayVisible[i] = 1;
+        
+        let alphaLevel = 0;
+        if (node.childCount > 10 && width * height > 10000) {
+            alphaLevel = 2;
+        } else if (node.childCount > 0 && width * height > 5000) {
+            alphaLevel = 1;
+        }
+        const typeCode = OVERLAY_TYPE_CODES[node.type] || 0;
+        bucketLists[alphaLevel * 4 + typeCode].push(i);
+    }
+    
+    overlayBuckets = bucketLists.map(list => Uint32Array.from(list));
+}
+
+// 绘制底层画布：每组颜色只描边一次
+function drawOverlayBase() {
+    const canvas = document.getElementById('overlayBaseCanvas');
+    const ctx = prepareOverlayCanvas(canvas);
+    ctx.clearRect(0, 0, canvas.clientWidth, canvas.clientHeight);
+    
+    if (!document.getElementById('showAllElements').checked) {
+        return;
+    }
+    
+    ctx.lineWidth = 1;
+    overlayBuckets.forEach((indices, bucket) => {
+        if (indices.length === 0) return;
+        ctx.globalAlpha = OVERLAY_ALPHAS[Math.floor(bucket / 4)];
+        ctx.strokeStyle = OVERLAY_STROKES[bucket % 4];
+        ctx.beginPath();
+        for (let k = 0; k < indices.length; k++) {
+            const i = indices[k];
+            if (!overlayVisible[i]) continue;
+            const x1 = overlayBounds[i * 4];
+            const y1 = overlayBounds[i * 4 + 1];
+            ctx.rect(x1 + 0.5, y1 + 0.5, overlayBounds[i * 4 + 2] - x1 - 1, overlayBounds[i * 4 + 3] - y1 - 1);
+        }
+        ctx.stroke();
+    });
+    ctx.globalAlpha = 1;
+}
+
+// 重绘顶层画布：只清除上次绘制过的区域，再绘制选中和悬停的元素
+function drawOverlayTop() {
+    const canvas = document.getElementById('overlayTopCanvas');
+    const ctx = prepareOverlayCanvas(canvas);
+    const margin = 3;
+    
+    overlayDirtyRects.forEach(rect => {
+        ctx.clearRect(rect[0] - margin, rect[1] - margin, rect[2] - rect[0] + margin * 2, rect[3] - rect[1] + margin * 2);
+    });
+    overlayDirtyRects = [];
+    
+    const drawIndex = (i, fill, stroke, dashed) => {
+        const x1 = overlayBounds[i * 4];
+        const y1 = overlayBounds[i * 4 + 1];
+        const x2 = overlayBounds[i * 4 + 2];
+        const y2 = overlayBounds[i * 4 + 3];
+        ctx.setLineDash(dashed ? [4, 3] : []);
+        ctx.lineWidth = 2;
+        if (fill) {
+            ctx.fillStyle = fill;
+            ctx.fillRect(x1, y1, x2 - x1, y2 - y1);
+        }
+        ctx.strokeStyle = stroke;
+        ctx.strokeRect(x1 + 1, y1 + 1, x2 - x1 - 2, y2 - y1 - 2);
+        overlayDirtyRects.push([x1, y1, x2, y2]);
+    };
+    
+    // 与.ui-element.selected样式一致
+    if (overlaySelectedIndex >= 0) {
+        drawIndex(overlaySelectedIndex, 'rgba(76, 175, 80, 0.3)', 'rgba(76, 175, 80, 1)', false);
+    }
+    if (overlayHoverIndex >= 0 && overlayHoverIndex !== overlaySelectedIndex) {
+        drawIndex(overlayHoverIndex, null, 'red', true);
+    }
+    ctx.setLineDash([]);
+}
+
+// 以画布方式渲染全部元素
+function renderCanvasOverlay() {
+    const startTime = performance.now();
+    buildOverlayArrays();
+    setOverlayCanvasVisible(document.getElementById('showElements').checked);
+    // 节点和缩放都已变化，整个顶层画布都需要重绘
+    const topCanvas = document.getElementById('overlayTopCanvas');
+    overlayDirtyRects = [[0, 0, topCanvas.clientWidth, topCanvas.clientHeight]];
+    drawOverlayBase();
+    drawOverlayTop();
+    
+    if (document.getElementById('hideOverlap').checked) {
+        hideOverlappingOverlay();
+    }
+    console.log(`画布渲染了 ${nodeData.length} 个节点，用时 ${(performance.now() - startTime).toFixed(1)}ms`);
+}
+
+// 设置选中的元素
+function setOverlaySelection(nodeId) {
+    const index = nodeId !== null && overlayIndexById.has(nodeId) ? overlayIndexById.get(nodeId) : -1;
+    if (index === overlaySelectedIndex) return;
+    overlaySelectedIndex = index;
+    drawOverlayTop();
+}
+
+// 设置悬停预览的元素
+function setOverlayHover(nodeId) {
+    const index = nodeId !== null && overlayIndexById.has(nodeId) ? overlayIndexById.get(nodeId) : -1;
+    if (index === overlayHoverIndex) return;
+    overlayHoverIndex = index;
+    drawOverlayTop();
+}
+
+// 判断画布坐标点是否在元素内
+function overlayContains(i, x, y) {
+    return x >= overlayBounds[i * 4] && x <= overlayBounds[i * 4 + 2] &&
+        y >= overlayBounds[i * 4 + 1] && y <= overlayBounds[i * 4 + 3];
+}
+
+// 查找包含画布坐标点的最小可见元素
+function findOverlayIndexAt(x, y) {
+    let best = -1;
+    let bestArea = Infinity;
+    for (let i = 0; i < overlayVisible.length; i++) {
+        if (!overlayVisible[i]) continue;
+        if (overlayContains(i, x, y) && overlayAreas[i] < bestArea) {
+            best = i;
+            bestArea = overlayAreas[i];
+        }
+    }
+    return best;
+}
+
+// 隐藏与更小元素重叠的元素，与DOM模式的toggleHideOverlap规则一致
+function hideOverlappingOverlay() {
+    const order = [];
+    for (let i = 0; i < overlayVisible.length; i++) {
+        if (overlayVisible[i]) order.push(i);
+    }
+    order.sort((a, b) => overlayAreas[a] - overlayAreas[b]);
+    if (order.length === 0) return;
+    
+    // 按面积从小到大依次放入均匀网格，每个元素只需与已放入且落在相同格子中的元素比较
+    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+    let totalWidth = 0, totalHeight = 0;
+    order.forEach(i => {
+        minX = Math.min(minX, overlayBounds[i * 4]);
+        minY = Math.min(minY, overlayBounds[i * 4 + 1]);
+        maxX = Math.max(maxX, overlayBounds[i * 4 + 2]);
+        maxY = Math.max(maxY, overlayBounds[i * 4 + 3]);
+        totalWidth += overlayBounds[i * 4 + 2] - overlayBounds[i * 4];
+        totalHeight += overlayBounds[i * 4 + 3] - overlayBounds[i * 4 + 1];
+    });
+    // 格子大小取元素的平均尺寸，多数元素只落在少数几个格子中
+    const columns = Math.max(1, Math.min(64, Math.ceil((maxX - minX) * order.length / Math.max(1, totalWidth))));
+    const rows = Math.max(1, Math.min(64, Math.ceil((maxY - minY) * order.length / Math.max(1, totalHeight))));
+    const cellWidth = Math.max(1, (maxX - minX) / columns);
+    const cellHeight = Math.max(1, (maxY - minY) / rows);
+    const cells = new Array(columns * rows);
+    const cellX = x => Math.min(columns - 1, Math.floor((x - minX) / cellWidth));
+    const cellY = y => Math.min(rows - 1, Math.floor((y - minY) / cellHeight));
+    
+    const hidden = [];
+    for (let j = 0; j < order.length; j++) {
+        const b = order[j];
+        const bx1 = overlayBounds[b * 4], by1 = overlayBounds[b * 4 + 1];
+        const bx2 = overlayBounds[b * 4 + 2], by2 = overlayBounds[b * 4 + 3];
+        const cx1 = cellX(bx1), cx2 = cellX(bx2), cy1 = cellY(by1), cy2 = cellY(by2);
+        
+        // 与更小的元素相交（含边界相接）时隐藏，选中的元素始终保留
+        let overlaps = false;
+        for (let cy = cy1; cy <= cy2 && !overlaps && b !== overlaySelectedIndex; cy++) {
+            for (let cx = cx1; cx <= cx2 && !overlaps; cx++) {
+                const cell = cells[cy * columns + cx];
+                if (!cell) continue;
+                for (let k = 0; k < cell.length; k++) {
+                    const a = cell[k];
+                    if (!(overlayBounds[a * 4 + 2] < bx1 || overlayBounds[a * 4] > bx2 ||
+                          overlayBounds[a * 4 + 3] < by1 || overlayBounds[a * 4 + 1] > by2)) {
+                        overlaps = true;
+                        break;
+                    }
+                }
+            }
+        }
+        if (overlaps) hidden.push(b);
+        
+        // 被隐藏的元素同样参与后续比较
+        for (let cy = cy1; cy <= cy2; cy++) {
+            for (let cx = cx1; cx <= cx2; cx++) {
+                const key = cy * columns + cx;
+                (cells[key] || (cells[key] = [])).push(b);
+            }
+        }
+    }
+    hidden.forEach(i => { overlayVisible[i] = 0; });
+    drawOverlayBase();
+}
+
+// 顶层画布的点击和悬停处理
+function setupOverlayCanvasHandlers() {
+    const canvas = document.getElementById('overlayTopCanvas');
+    if (!canvas || canvas.dataset.handlersReady) return;
+    canvas.dataset.handlersReady = 'true';
+    
+    canvas.addEventListener('mousemove', function(e) {
+        const rect = canvas.getBoundingClientRect();
+        const x = e.clientX - rect.left;
+        const y = e.clientY - rect.top;
+        // 与DOM模式一致，不显示所有元素时不响应悬停
+        if (!document.getElementById('showAllElements').checked) {
+            setOverlayHover(null);
+            return;
+        }
+        if (overlayHoverFrame) return;
+        overlayHoverFrame = requestAnimationFrame(() => {
+            overlayHoverFrame = null;
+            const index = findOverlayIndexAt(x, y);
+            setOverlayHover(index >= 0 ? overlayNodeIds[index] : null);
+        });
+    });
+    
+    canvas.addEventListener('mouseleave', function() {
+        setOverlayHover(null);
+    });
+    
+    canvas.addEventListener('click', function(e) {
+        e.stopPropagation();
+        const rect = canvas.getBoundingClientRect();
+        const x = e.clientX - rect.left;
+        const y = e.clientY - rect.top;
+        // 不显示所有元素时只有选中的元素可点击，与DOM模式中其余元素被隐藏的效果一致
+        let index;
+        if (document.getElementById('showAllElements').checked) {
+            index = findOverlayIndexAt(x, y);
+        } else {
+            index = overlaySelectedIndex >= 0 && overlayContains(overlaySelectedIndex, x, y) ? overlaySelectedIndex : -1;
+        }
+        if (index >= 0 && (isDeepSelectionMode || e.shiftKey)) {
+            findAndShowElementsAtPosition(e.clientX, e.clientY);
+            return;
+        }
+        if (index >= 0) {
+            showNodeDetails(overlayNodeIds[index]);
+        } else {
+            clearSelection();
+        }
+    });
+}
+
 // 显示/隐藏所有元素
 function toggleAllElements() {
+    if (isCanvasMode()) {
+        drawOverlayBase();
+        return;
+    }
+    
     const showAll = document.getElementById('showAllElements').checked;
     const elements = document.querySelectorAll('.ui-element');
     
@@ -429,6 +794,15 @@ function toggleAllElements() {
 // 隐藏/显示重叠元素
 function toggleHideOverlap() {
     const hideOverlap = document.getElementById('hideOverlap').checked;
+    if (isCanvasMode()) {
+        if (hideOverlap) {
+            hideOverlappingOverlay();
+        } else {
+            renderCanvasOverlay();
+            setOverlaySelection(selectedNodeId);
+        }
+        return;
+    }
     if (!hideOverlap) {
         renderAllElements();
         if (selectedNodeId) {
@@ -481,6 +855,11 @@ function checkOverlap(el1, el2) {
 
 // 高亮显示元素
 function highlightElement(nodeId) {
+    if (isCanvasMode()) {
+        setOverlaySelection(nodeId);
+        return;
+    }
+    
     // 移除之前的高亮
     document.querySelectorAll('.ui-element.selected').forEach(el => {
         el.classList.remove('selected');
@@ -1239,6 +1618,9 @@ function initClickHandlers() {
         clearButton.addEventListener('click', clearSelectionHandler);
     }
     
+    // 画布渲染模式的点击和悬停处理
+    setupOverlayCanvasHandlers();
+    
     // 添加点击空白区域取消选择的处理
     const phoneScreen = document.getElementById('phoneScreen');
     const contentWrapper = document.getElementById('contentWrapper');
@@ -1357,6 +1739,11 @@ function clearSelection() {
             }
         });
         
+        // 清除画布中的选中框
+        if (isCanvasMode()) {
+            setOverlaySelection(null);
+        }
+        
         // 清除树中的高亮
         document.querySelectorAll('.highlight').forEach(el => {
             console.log(`清除树节点高亮: ${el.id}`);
@@ -1482,6 +1869,10 @@ function showLayerSelectionMenu(nodes, x, y) {
         option.onmouseover = function() {
             this.style.backgroundColor = '#f0f0f0';
             // 预览高亮相应元素
+            if (isCanvasMode()) {
+                setOverlayHover(node.id);
+                return;
+            }
             const element = document.getElementById('ui-element-' + node.id);
             if (element) {
                 element.style.border = '2px dashed red';
@@ -1492,6 +1883,10 @@ function showLayerSelectionMenu(nodes, x, y) {
         option.onmouseout = function() {
             this.style.backgroundColor = '';
             // 移除预览高亮
+            if (isCanvasMode()) {
+                setOverlayHover(null);
+                return;
+            }
             const element = document.getElementById('ui-element-' + node.id);
             if (element && !element.classList.contains('selected')) {
                 element.style.border = '';
@@ -1596,6 +1991,64 @@ function showLayerSelectionMenu(nodes, x, y) {
     }, 10);
 }
 
+// 记录选中节点和已展开节点的稳定ID，捕获刷新后位置ID可能变化
+function saveViewState() {
+    const state = { selectedStableId: null, openStableIds: [] };
+    if (!nodeData || nodeData.length === 0) {
+        return state;
+    }
+    
+    const nodesById = new Map(nodeData.map(node => [node.id, node]));
+    if (selectedNodeId && nodesById.has(selectedNodeId)) {
+        state.selectedStableId = nodesById.get(selectedNodeId).stable_id || null;
+    }
+    document.querySelectorAll('#uiTree details[open] > summary').forEach(summary => {
+        const node = nodesById.get(summary.id);
+        if (node && node.stable_id) {
+            state.openStableIds.push(node.stable_id);
+        }
+    });
+    return state;
+}
+
+// 根据稳定ID恢复展开状态和选中节点
+function restoreViewState(state) {
+    if (!state || !nodeData || nodeData.length === 0) {
+        return;
+    }
+    
+    const idsByStableId = new Map();
+    nodeData.forEach(node => {
+        if (node.stable_id) {
+            idsByStableId.set(node.stable_id, node.id);
+        }
+    });
+    
+    state.openStableIds.forEach(stableId => {
+        const nodeId = idsByStableId.get(stableId);
+        const summary = nodeId ? document.getElementById(nodeId) : null;
+        if (summary && summary.parentElement && summary.parentElement.tagName.toLowerCase() === 'details') {
+            summary.parentElement.open = true;
+        }
+    });
+    
+    if (state.selectedStableId) {
+        const nodeId = idsByStableId.get(state.selectedStableId);
+        if (nodeId) {
+            // 只恢复选中和高亮，不滚动树也不重建详情面板，避免每次自动捕获都打断浏览
+            selectedNodeId = nodeId;
+            highlightElement(nodeId);
+            const treeNode = findTreeNodeById(nodeId);
+            if (treeNode) {
+                treeNode.classList.add('highlight');
+            }
+        } else {
+            console.log(`选中的节点在新的捕获中已不存在: ${state.selectedStableId}`);
+            selectedNodeId = null;
+        }
+    }
+}
+
 // 初始化WebSocket连接
 function initSocketConnection() {
     try {
@@ -1605,6 +2058,11 @@ function initSocketConnection() {
         socket.on('connect', function() {
             console.log('WebSocket连接成功');
             showStatusMessage('WebSocket连接成功', 'success');
+            // 重连后服务端已丢弃旧连接的订阅，仍勾选实时画面时重新订阅
+            if (document.getElementById('liveStream').checked) {
+                isStreaming = true;
+                socket.emit('start_screen_stream', { fps: 10 });
+            }
         });
         
         socket.on('disconnect', function() {
@@ -1623,6 +2081,9 @@ function initSocketConnection() {
                 }
             });
             
+            // 记录刷新前的选中和展开状态
+            const viewState = saveViewState();
+            
             // 更新UI
             if (data.nodes) {
                 nodeData = data.nodes;
@@ -1634,7 +2095,10 @@ function initSocketConnection() {
                 setupTreeListeners();
             }
             
-            if (data.screenshot) {
+            restoreViewState(viewState);
+            
+            // 实时画面开启时截图由屏幕流更新，避免回退到较旧的帧
+            if (data.screenshot && !isStreamLive()) {
                 deviceScreenshot.src = "data:image/png;base64," + data.screenshot;
                 deviceScreenshot.style.display = 'block';
             }
@@ -1645,6 +2109,33 @@ function initSocketConnection() {
             loadingIndicator.style.display = 'none';
         });
         
+        socket.on('screen_frame', function(data) {
+            if (!isStreaming) {
+                return;
+            }
+            lastStreamFrameTime = Date.now();
+            deviceScreenshot.src = `data:${data.mimetype};base64,${data.image}`;
+            deviceScreenshot.style.display = 'block';
+            
+            // 解码完成后确认该帧，服务端据此决定是否丢弃后续帧
+            const ack = () => socket.emit('screen_frame_ack', { seq: data.seq });
+            if (deviceScreenshot.decode) {
+                deviceScreenshot.decode().then(ack, ack);
+            } else {
+                ack();
+            }
+        });
+        
+        socket.on('stream_status', function(status) {
+            console.log('屏幕流状态:', status);
+            // 启动失败，或断开设备、设备掉线等原因导致屏幕流停止
+            if (!status.enabled && isStreaming) {
+                isStreaming = false;
+                document.getElementById('liveStream').checked = false;
+                showStatusMessage('实时画面已停止' + (status.error ? ': ' + status.error : ''), 'error');
+            }
+        });
+        
         socket.on('connect_error', function(error) {
             console.error('WebSocket连接错误:', error);
             showStatusMessage('WebSocket连接错误', 'error');
@@ -1730,6 +2221,25 @@ function initUIControls() {
             });
         }
         
+        // 会话录制按钮
+        document.getElementById('start-recording').addEventListener('click', function() {
+            startRecording();
+        });
+        document.getElementById('stop-recording').addEventListener('click', function() {
+            stopRecording();
+        });
+        document.getElementById('load-session').addEventListener('click', function() {
+            loadSession();
+        });
+        
+        // 会话回放滑块，拖动时只请求最后停留的帧
+        const sessionSlider = document.getElementById('session-frame-slider');
+        sessionSlider.addEventListener('input', function() {
+            document.getElementById('session-frame-label').textContent = `${parseInt(this.value) + 1}/${parseInt(this.max) + 1}`;
+            clearTimeout(sessionFrameTimer);
+            sessionFrameTimer = setTimeout(() => showSessionFrame(parseInt(this.value)), 150);
+        });
+        
         console.log("UI控件初始化完成");
     } catch (error) {
         console.error('初始化UI控件失败:', error);
@@ -1875,6 +2385,9 @@ function captureOnce() {
                     }
                 });
                 
+                // 记录刷新前的选中和展开状态
+                const viewState = saveViewState();
+                
                 // 更新UI
                 if (data.node_data) {
                     nodeData = data.node_data;
@@ -1886,7 +2399,9 @@ function captureOnce() {
                     setupTreeListeners();
                 }
                 
-                if (data.screenshot_url) {
+                restoreViewState(viewState);
+                
+                if (data.screenshot_url && !isStreamLive()) {
                     deviceScreenshot.src = data.screenshot_url;
                     deviceScreenshot.style.display = 'block';
                 }
@@ -1998,6 +2513,116 @@ function stopAutoCapture() {
     });
 }
 
+// 开始录制会话
+function startRecording() {
+    fetch('/api/session/start', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({})
+    })
+    .then(response => response.json())
+    .then(data => {
+        console.log("开始录制结果:", data);
+        if (data.success) {
+            updateRecordingButtons(true);
+            showStatusMessage('会话录制已开始: ' + data.status.path, 'success');
+        } else {
+            showStatusMessage('开始录制失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('开始录制失败:', error);
+        showStatusMessage('开始录制失败', 'error');
+    });
+}
+
+// 停止录制会话
+function stopRecording() {
+    fetch('/api/session/stop', { method: 'POST' })
+    .then(response => response.json())
+    .then(data => {
+        console.log("停止录制结果:", data);
+        if (data.success) {
+            updateRecordingButtons(false);
+            showStatusMessage(`会话录制已停止，共 ${data.status.frame_count} 帧`, 'success');
+        } else {
+            showStatusMessage('停止录制失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('停止录制失败:', error);
+        showStatusMessage('停止录制失败', 'error');
+    });
+}
+
+// 更新录制按钮状态
+function updateRecordingButtons(recording) {
+    document.getElementById('start-recording').style.display = recording ? 'none' : 'inline-block';
+    document.getElementById('stop-recording').style.display = recording ? 'inline-block' : 'none';
+}
+
+// 加载最近录制的会话用于回放
+function loadSession() {
+    fetch('/api/session/frames')
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showStatusMessage('加载会话失败: ' + data.error, 'error');
+            return;
+        }
+        if (data.frames.length === 0) {
+            showStatusMessage('会话中没有帧', 'warning');
+            return;
+        }
+        
+        const slider = document.getElementById('session-frame-slider');
+        slider.max = data.frames.length - 1;
+        slider.value = data.frames.length - 1;
+        document.getElementById('session-frame-label').textContent = `${data.frames.length}/${data.frames.length}`;
+        document.getElementById('session-playback').style.display = 'block';
+        showSessionFrame(data.frames.length - 1);
+    })
+    .catch(error => {
+        console.error('加载会话失败:', error);
+        showStatusMessage('加载会话失败', 'error');
+    });
+}
+
+// 显示会话中的指定帧
+function showSessionFrame(frame) {
+    fetch(`/api/session/frame/${frame}`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showStatusMessage('读取会话帧失败: ' + (data.error || '未知错误'), 'error');
+            return;
+        }
+        
+        const viewState = saveViewState();
+        
+        if (data.node_data) {
+            nodeData = data.node_data;
+            initPhoneScreen();
+        }
+        
+        if (data.tree_html) {
+            document.getElementById('uiTree').innerHTML = data.tree_html;
+            setupTreeListeners();
+        }
+        
+        restoreViewState(viewState);
+        
+        if (data.screenshot_url) {
+            deviceScreenshot.src = data.screenshot_url;
+            deviceScreenshot.style.display = 'block';
+        }
+    })
+    .catch(error => {
+        console.error('读取会话帧失败:', error);
+        showStatusMessage('读取会话帧失败', 'error');
+    });
+}
+
 // 获取当前状态
 function updateStatus() {
     console.log("获取当前状态");
@@ -2083,6 +2708,29 @@ function toggleScreenshot() {
 function toggleElements() {
     const show = document.getElementById('showElements').checked;
     document.getElementById('contentWrapper').style.display = show ? 'block' : 'none';
+    if (isCanvasMode()) {
+        setOverlayCanvasVisible(show);
+    }
+}
+
+// 实时画面是否在持续更新，订阅了但近期没有收到帧时视为未更新
+function isStreamLive() {
+    return isStreaming && Date.now() - lastStreamFrameTime < STREAM_STALE_MS;
+}
+
+// 开启/关闭实时屏幕流
+function toggleScreenStream() {
+    isStreaming = document.getElementById('liveStream').checked;
+    if (!socket) {
+        return;
+    }
+    if (isStreaming) {
+        socket.emit('start_screen_stream', { fps: 10 });
+        showStatusMessage('实时画面已开启', 'info');
+    } else {
+        socket.emit('stop_screen_stream');
+        showStatusMessage('实时画面已关闭', 'info');
+    }
 }
 
 // 辅助函数：查找树节点元素